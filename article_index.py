@@ -0,0 +1,468 @@
+# article_index.py
+"""
+Article vector index kept next to `rss_articles` in the RSS database.
+
+`rss_pull.run_pipeline` calls `index_missing` after each ingest, so every
+article is embedded once (in batches) when it arrives.  The vectors live in
+an `article_vectors` table (float32 BLOB per article and embedding model);
+`load_index` reads the recent window back as (articles, matrix) without any
+embedding calls, which is what RelevanceEngine.from_index builds on.  It
+pages through the window with `iter_articles`, the column-projected loader
+that `rss_parser.load_articles_from_db` also uses.
+
+`tag_missing` does the same for topic tags: new articles are tagged in
+batches (one chat call per config.ARTICLE_TAG_BATCH articles) and the tags
+are stored in `rss_articles.tags`, comma-separated like `categories`.
+
+Article bodies are stored twice by `rss_pull.insert_articles`: as plain
+text (`content_text`, see `plain_text`), which is what every analysis stage
+reads, and as zlib-compressed raw HTML (`content_html`, see `article_html`)
+for display.  Databases are migrated by `rss_pull.setup_database` only
+(`ensure_schema`); the readers here (`index_missing`, `load_index`,
+`bm25_candidates`) query whatever columns an older file has (`_article_select`)
+instead of rewriting it.
+
+`cluster_since` groups near-duplicate articles at ingest (SimHash over the
+plain text, `rss_articles.simhash` / `cluster_id`; the newest copy
+represents its cluster and takes over the previous one's vector, tags and
+notice matches).  Every query below only looks at representatives
+(`_REPRESENTATIVE`), so a story carried by several section feeds is embedded,
+tagged, scored and given an impact paragraph once.
+
+`rss_articles_fts` is an FTS5 full-text index (rowid = article id) over the
+title, description and plain-text content, kept in step by
+`rss_pull.insert_articles`.  `bm25_candidates` ranks the lookback window
+against a notice's tags and title with it, so the relevance stage only scores
+each notice's best candidates.
+"""
+import hashlib
+import html
+import re
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import config
+import telemetry
+from news_relevance import embed_many, article_text, generate_article_tags_batch, _embedding_model
+
+
+def ensure_index(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS article_vectors (
+            article_id INTEGER NOT NULL,
+            model      TEXT NOT NULL,
+            dim        INTEGER NOT NULL,
+            vec        BLOB NOT NULL,
+            PRIMARY KEY (article_id, model)
+        )
+    """)
+    conn.commit()
+
+
+def ensure_pub_date_index(conn: sqlite3.Connection) -> None:
+    """Index the lookback filter (`pub_date >= datetime('now', ...)`) every query here uses."""
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_rss_articles_pub_date ON rss_articles(pub_date)")
+    conn.commit()
+
+
+def ensure_schema(conn: sqlite3.Connection) -> None:
+    """
+    Bring an rss_articles table of any earlier version up to what this module
+    queries (indexes, tag and cluster columns, FTS).  Only setup_database
+    calls it, after rss_pull.migrate_content_storage.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rss_articles'"
+    ).fetchone()
+    if not exists:
+        return
+    ensure_pub_date_index(conn)
+    ensure_tag_column(conn)
+    ensure_clusters(conn)
+    try:
+        ensure_fts(conn)
+    except sqlite3.OperationalError as e:     # SQLite built without FTS5
+        print(f"⚠️ No full-text index ({e}); relevance falls back to scoring the whole window")
+
+
+def ensure_tag_column(conn: sqlite3.Connection) -> None:
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(rss_articles)")}
+    if "tags" not in columns:
+        conn.execute("ALTER TABLE rss_articles ADD COLUMN tags TEXT")
+        conn.commit()
+
+
+# elements whose content is never article prose (embeds, scripts, photo credits, related links)
+_BOILERPLATE = re.compile(r"<(script|style|iframe|figure|aside|noscript)\b.*?</\1\s*>", re.S | re.I)
+
+
+def plain_text(markup: str | None) -> str:
+    """Boilerplate elements dropped, tags stripped, entities decoded, whitespace collapsed."""
+    text = re.sub(r"<[^>]+>", " ", _BOILERPLATE.sub(" ", markup or ""))
+    return " ".join(html.unescape(text).split())
+
+
+def compress_html(markup: str | None) -> bytes | None:
+    return zlib.compress(markup.encode("utf-8"), 9) if markup else None
+
+
+def article_html(article: dict) -> str:
+    """The original body HTML of an article loaded with the "content_html" column."""
+    blob = article.get("content_html")
+    return zlib.decompress(blob).decode("utf-8") if blob else ""
+
+
+# SQL condition: the article is the representative of its near-duplicate cluster
+_REPRESENTATIVE = "(a.cluster_id IS NULL OR a.cluster_id = a.id)"
+
+
+def _article_select(conn: sqlite3.Connection, columns: tuple[str, ...]) -> tuple[str, str, bool]:
+    """
+    SELECT list for `columns` of `rss_articles a` on the file's actual schema,
+    the representative condition, and whether content_text is served from a
+    not-yet-migrated `content_encoded` (raw HTML, see _article).  Columns the
+    table doesn't have come back as NULL.
+    """
+    present = {r[1] for r in conn.execute("PRAGMA table_info(rss_articles)")}
+    legacy = "content_text" not in present and "content_encoded" in present
+
+    def _column(c):
+        if c in present:
+            return f"a.{c}"
+        return "a.content_encoded" if c == "content_text" and legacy else "NULL"
+
+    representative = _REPRESENTATIVE if "cluster_id" in present else "1"
+    return ", ".join(_column(c) for c in columns), representative, legacy
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash of the word 3-shingles of `text` (as a signed int, for SQLite)."""
+    words = re.findall(r"\w+", text.lower())
+    shingles = {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))}
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(sh.encode("utf-8"), digest_size=8).digest(), "little")
+         for sh in shingles],
+        dtype=np.uint64,
+    )
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(hashes)
+    fingerprint = np.packbits(votes > 0, bitorder="little").view(np.uint64)[0]
+    return int(fingerprint.view(np.int64))
+
+
+def ensure_clusters(conn: sqlite3.Connection) -> None:
+    """Add the simhash / cluster_id columns and cluster the lookback window the first time."""
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(rss_articles)")}
+    if "cluster_id" in columns:
+        return
+    conn.execute("ALTER TABLE rss_articles ADD COLUMN simhash INTEGER")
+    conn.execute("ALTER TABLE rss_articles ADD COLUMN cluster_id INTEGER")
+    n = cluster_since(conn, 0)
+    conn.commit()
+    if n:
+        print(f"🧬 Collapsed {n} near-duplicate article(s) into existing clusters.")
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+
+def _hamming(fingerprints: np.ndarray, fp: int) -> np.ndarray:
+    """Differing bits between each uint64 fingerprint and `fp`."""
+    diff = fingerprints ^ np.int64(fp).view(np.uint64)
+    return np.unpackbits(diff.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def _move_representative(conn: sqlite3.Connection, old_id: int, new_id: int) -> None:
+    """
+    Make `new_id` represent `old_id`'s cluster, taking over its vector,
+    tags and notice matches, so the story is neither embedded, tagged nor
+    given an impact paragraph again.
+    """
+    conn.execute("UPDATE rss_articles SET cluster_id = ? WHERE cluster_id = ?", (new_id, old_id))
+    conn.execute(
+        "UPDATE rss_articles SET tags = COALESCE(tags, (SELECT tags FROM rss_articles WHERE id = ?)) "
+        "WHERE id = ?", (old_id, new_id),
+    )
+    for table in ("article_vectors", "notice_article_matches"):
+        if _table_exists(conn, table):
+            conn.execute(f"UPDATE OR IGNORE {table} SET article_id = ? WHERE article_id = ?", (new_id, old_id))
+
+
+def cluster_since(conn: sqlite3.Connection, after_id: int) -> int:
+    """
+    SimHash the lookback window's rss_articles rows with id > `after_id` and
+    put each into the cluster of the nearest representative within
+    NEAR_DUPLICATE_MAX_BITS bits, or a new cluster of its own (the caller
+    commits).  The newest copy represents its cluster (see
+    _move_representative), so a cluster stays visible for as long as any
+    copy is in the window.  Returns how many rows joined an existing cluster.
+    """
+    if not config.CLUSTER_NEAR_DUPLICATES:
+        return 0
+    known = conn.execute(f"""
+        SELECT a.id, a.simhash FROM rss_articles a
+        WHERE a.id <= ? AND a.simhash IS NOT NULL AND {_REPRESENTATIVE}
+          AND a.pub_date >= datetime('now', ?)
+    """, (after_id, config.ARTICLE_LOOKBACK)).fetchall()
+    rows = conn.execute("""
+        SELECT id, title, description, content_text FROM rss_articles
+        WHERE id > ? AND pub_date >= datetime('now', ?)
+        ORDER BY id
+    """, (after_id, config.ARTICLE_LOOKBACK)).fetchall()
+
+    # representatives' ids and fingerprints; new clusters are appended after n
+    rep_ids = [r[0] for r in known] + [0] * len(rows)
+    fingerprints = np.zeros(len(rep_ids), dtype=np.uint64)
+    fingerprints[:len(known)] = np.array([r[1] for r in known], dtype=np.int64).view(np.uint64)
+    n, joined = len(known), 0
+    for article_id, title, description, content_text in rows:
+        text = content_text or f"{title or ''} {description or ''}"
+        if not re.search(r"\w", text):      # nothing to compare: a cluster of its own
+            conn.execute("UPDATE rss_articles SET cluster_id = id WHERE id = ?", (article_id,))
+            continue
+        fp = simhash(text)
+        distances = _hamming(fingerprints[:n], fp)
+        k = int(np.argmin(distances)) if n else -1
+        if k >= 0 and distances[k] <= config.NEAR_DUPLICATE_MAX_BITS:
+            _move_representative(conn, rep_ids[k], article_id)
+            joined += 1
+        else:
+            k, n = n, n + 1
+        rep_ids[k] = article_id
+        fingerprints[k] = np.int64(fp).view(np.uint64)
+        conn.execute("UPDATE rss_articles SET simhash = ?, cluster_id = id WHERE id = ?", (fp, article_id))
+    return joined
+
+
+def ensure_fts(conn: sqlite3.Connection) -> None:
+    """Create the FTS5 index and fill it from rss_articles the first time."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'rss_articles_fts'"
+    ).fetchone()
+    if exists:
+        return
+    # external content: the index reads the text from rss_articles instead of keeping a copy
+    conn.execute("""
+        CREATE VIRTUAL TABLE rss_articles_fts
+        USING fts5(title, description, content_text, content = 'rss_articles', content_rowid = 'id',
+                   tokenize = 'porter unicode61')
+    """)
+    fts_index_since(conn, 0)
+    conn.commit()
+
+
+def fts_index_since(conn: sqlite3.Connection, after_id: int) -> int:
+    """Add the rss_articles rows with id > `after_id` to the FTS index (the caller commits)."""
+    rows = conn.execute(
+        "SELECT id, title, description, content_text FROM rss_articles WHERE id > ?", (after_id,)
+    ).fetchall()
+    conn.executemany(
+        "INSERT INTO rss_articles_fts (rowid, title, description, content_text) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+    return len(rows)
+
+
+def _fts_query(terms: list[str]) -> str:
+    """OR of the distinct words in `terms`, each quoted for FTS5."""
+    words = dict.fromkeys(w.lower() for t in terms for w in re.findall(r"\w{3,}", t))
+    return " OR ".join(f'"{w}"' for w in words)
+
+
+def bm25_candidates(conn: sqlite3.Connection,
+                    terms: list[str],
+                    limit: int,
+                    since_id: int = 0) -> list[int]:
+    """
+    Ids of the `limit` best BM25 matches for `terms` among the lookback
+    window's articles with id > `since_id`, best first.
+    """
+    query = _fts_query(terms)
+    if not query:
+        return []
+    _, representative, _ = _article_select(conn, ())
+    rows = conn.execute(f"""
+        SELECT f.rowid
+        FROM rss_articles_fts f
+        JOIN rss_articles a ON a.id = f.rowid
+        WHERE rss_articles_fts MATCH ? AND a.id > ? AND a.pub_date >= datetime('now', ?)
+          AND {representative}
+        ORDER BY bm25(rss_articles_fts)
+        LIMIT ?
+    """, (query, since_id, config.ARTICLE_LOOKBACK, limit)).fetchall()
+    return [r[0] for r in rows]
+
+
+# columns of the article dicts below, in row order (see _article)
+_ARTICLE_COLUMNS = ("id", "title", "description", "content_text", "link")
+
+
+def _article(row, legacy: bool = False) -> dict:
+    article = {
+        "id": row[0],
+        "title": row[1],
+        "description": row[2],
+        "content_text": plain_text(row[3]) if legacy else row[3],
+        "link": row[4],
+    }
+    if len(row) > 5:
+        article["tags"] = row[5]
+    return article
+
+
+# everything analysis needs except the body; add "content_text" (or "content_html"
+# for display, see article_html) when it is wanted
+ARTICLE_COLUMNS = ("id", "title", "description", "link", "pub_date", "tags", "cluster_id")
+
+
+def iter_articles(conn: sqlite3.Connection,
+                  columns: tuple[str, ...] = ARTICLE_COLUMNS,
+                  page_size: int = 500,
+                  model: str | None = None):
+    """
+    Yield the lookback window's articles (cluster representatives) as dicts
+    of `columns`, oldest first, reading `page_size` rows per query (keyset
+    pagination on id).  With `model`, only articles that have a vector for
+    it are yielded, each with its float32 bytes under "vec".
+    """
+    columns = tuple(dict.fromkeys(("id", *columns)))
+    select, representative, legacy = _article_select(conn, columns)
+    join, params = "", ()
+    if model is not None:
+        select += ", v.vec"
+        join, params = "JOIN article_vectors v ON v.article_id = a.id AND v.model = ?", (model,)
+    body = columns.index("content_text") if legacy and "content_text" in columns else None
+    last_id = 0
+    while True:
+        rows = conn.execute(f"""
+            SELECT {select}
+            FROM rss_articles a
+            {join}
+            WHERE a.pub_date >= datetime('now', ?) AND {representative} AND a.id > ?
+            ORDER BY a.id
+            LIMIT ?
+        """, (*params, config.ARTICLE_LOOKBACK, last_id, page_size)).fetchall()
+        for row in rows:
+            article = dict(zip(columns, row))
+            if body is not None:
+                article["content_text"] = plain_text(row[body])
+            if model is not None:
+                article["vec"] = row[-1]
+            yield article
+        if len(rows) < page_size:
+            break
+        last_id = rows[-1][0]
+
+
+def index_missing(conn: sqlite3.Connection, model: str | None = None, batch_size: int = 1000) -> int:
+    """
+    Embed the articles in the lookback window that have no vector for `model`
+    yet and store them.  Returns the number of articles indexed.
+    """
+    model = _embedding_model(model)
+    ensure_index(conn)
+    select, representative, legacy = _article_select(conn, _ARTICLE_COLUMNS)
+    rows = conn.execute(f"""
+        SELECT {select}
+        FROM rss_articles a
+        LEFT JOIN article_vectors v ON v.article_id = a.id AND v.model = ?
+        WHERE v.article_id IS NULL AND a.pub_date >= datetime('now', ?) AND {representative}
+    """, (model, config.ARTICLE_LOOKBACK)).fetchall()
+
+    for i in range(0, len(rows), batch_size):
+        part = rows[i:i + batch_size]
+        vectors = embed_many([article_text(_article(r, legacy)) for r in part], model)
+        conn.executemany(
+            "INSERT OR REPLACE INTO article_vectors (article_id, model, dim, vec) VALUES (?, ?, ?, ?)",
+            [(r[0], model, len(v), v.tobytes()) for r, v in zip(part, vectors)],
+        )
+        conn.commit()
+    return len(rows)
+
+
+def tag_missing(conn: sqlite3.Connection, batch_size: int | None = None) -> int:
+    """
+    Topic-tag the articles in the lookback window that have no tags yet.
+    Batches run concurrently; a failed batch is left for the next ingest.
+    Returns the number of articles tagged.
+    """
+    batch_size = batch_size or config.ARTICLE_TAG_BATCH
+    rows = conn.execute(f"""
+        SELECT a.id, a.title, a.description, a.content_text, a.link
+        FROM rss_articles a
+        WHERE a.tags IS NULL AND a.pub_date >= datetime('now', ?) AND {_REPRESENTATIVE}
+    """, (config.ARTICLE_LOOKBACK,)).fetchall()
+    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    def _tag(batch):
+        try:
+            return generate_article_tags_batch([article_text(_article(r)) for r in batch])
+        except Exception as e:
+            print(f"⚠️ Tagging a batch of {len(batch)} articles failed: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=config.ARTICLE_TAG_WORKERS) as pool:
+        results = list(pool.map(telemetry.bind(_tag), batches))
+
+    tagged = [(", ".join(tags), r[0])
+              for batch, batch_tags in zip(batches, results) if batch_tags is not None
+              for r, tags in zip(batch, batch_tags)]
+    conn.executemany("UPDATE rss_articles SET tags = ? WHERE id = ?", tagged)
+    conn.commit()
+    return len(tagged)
+
+
+# (db_path, model) -> (window_key, articles, matrix) of the last window loaded
+_WINDOW_CACHE: dict[tuple, tuple[tuple, list[dict], np.ndarray]] = {}
+
+
+def window_key(conn: sqlite3.Connection) -> tuple[int, str]:
+    """Changes when an article is ingested (max id) or the lookback window moves (day)."""
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM rss_articles").fetchone()[0]
+    return max_id, time.strftime("%Y-%m-%d")
+
+
+def load_index(db_path: str = config.DB_NAME,
+               model: str | None = None) -> tuple[list[dict], np.ndarray]:
+    """
+    Articles in the lookback window and their embedding matrix (one float32
+    row per article, same order).  Articles ingested before the index existed
+    are embedded and stored on the way.  Only the columns relevance needs are
+    read (never the body HTML), a page at a time (`iter_articles`), and the
+    result is cached per process until
+    `window_key` changes, so repeated requests (the dashboard's single
+    solicitations) neither re-read the window nor rescan for missing vectors.
+    Callers must not mutate the returned articles or matrix.
+    """
+    model = _embedding_model(model)
+    conn = sqlite3.connect(db_path)
+    try:
+        key = window_key(conn)
+        cached = _WINDOW_CACHE.get((db_path, model))
+        if cached is not None and cached[0] == key:
+            return cached[1], cached[2]
+        complete = True
+        try:
+            n = index_missing(conn, model)
+            if n:
+                print(f"🧭 Indexed {n} article(s) that had no stored vector")
+        except Exception as e:
+            complete = False      # not cached: the next call retries the missing vectors
+            print(f"⚠️ Could not index new articles ({e}); using stored vectors only")
+        articles = list(iter_articles(conn, _ARTICLE_COLUMNS + ("tags",), model=model))
+    finally:
+        conn.close()
+
+    vectors = [article.pop("vec") for article in articles]
+    if vectors:
+        matrix = np.frombuffer(b"".join(vectors), dtype=np.float32).reshape(len(vectors), -1)
+    else:
+        matrix = np.zeros((0, 0), dtype=np.float32)
+    if complete:
+        _WINDOW_CACHE[(db_path, model)] = (key, articles, matrix)
+    return articles, matrix
@@ -28,6 +28,7 @@ def render_award_insights():
             )
 
         force_rerun = False
+        run_id = None
 
         if not runs_df.empty:
             run_id = runs_df["run_id"].iloc[0]
@@ -53,7 +54,7 @@ def render_award_insights():
             insights = get_all_usaspending_insights(naics_code)
 
             if any(not df.empty for df in insights.values()):
-                push_insights_to_db(insights, naics_code)
+                run_id = push_insights_to_db(insights, naics_code)
                 st.success(f"✅ Data for NAICS {naics_code} collected and saved.")
 
                 top_df = insights["top_recipients"].copy()
@@ -83,7 +84,9 @@ def render_award_insights():
         )
         st.plotly_chart(fig_top, use_container_width=True)
         with st.spinner("Analyzing competitors with Perplexity..."):
-            insight_1 = generate_competitor_positioning_insight(top_df, company_info, perplexity_key=PERPLEXITY_KEY)
+            insight_1 = generate_competitor_positioning_insight(top_df, company_info,
+                                                                perplexity_key=PERPLEXITY_KEY,
+                                                                run_id=run_id)
         st.markdown(f"**Competitive Insight:** {insight_1}")
 
 
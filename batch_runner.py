@@ -0,0 +1,500 @@
+# batch_runner.py
+"""
+Offline batch mode for the SAM / EU pipelines.
+
+Instead of calling the chat API once per prompt, every prompt of a stage is
+written to a JSONL file in the Batch API request format, submitted (or replayed
+against a local stand-in endpoint), polled, and the replies are ingested by
+``custom_id``.  Dependent stages are scheduled once their inputs are ingested:
+
+    insights  ->  swot + tags  ->  news impacts
+
+With config.GPT_SINGLE_PASS_ANALYSIS the first batch carries the single JSON
+analysis prompt and the SWOT/tags batch is empty.
+
+Everything lives under ``config.BATCH_DIR/<run_name>/`` and ``state.json`` is
+rewritten after every transition, so an interrupted run picks up exactly where
+it stopped when it is started again with the same run name.
+"""
+import os
+import sys
+import json
+import time
+import datetime
+
+import config
+import telemetry
+from file_utils import extract_text_from_files, truncate_to_token_limit
+from gpt_analysis import (
+    client,
+    _OPENAI_V1,
+    _chat_complete,
+    build_insights_messages,
+    build_swot_messages,
+    build_tags_messages,
+    build_news_impact_messages,
+    build_structured_analysis_messages,
+    parse_structured_analysis,
+    structured_to_row_fields,
+    parse_tags,
+)
+from llm_cache import stable_hash
+from model_router import model_for
+from notice_matches import register_notice, record_matches
+from relevance_engine import RelevanceEngine
+
+STAGES = ("insights", "swot_tags", "impacts")
+TERMINAL_BATCH_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+# ----------------------------------------------------------------------------
+# State on disk
+# ----------------------------------------------------------------------------
+def default_run_name(source: str, jobs: dict | None = None) -> str:
+    """<source>_<date>, plus a hash of the job ids so a new set of jobs gets a new run."""
+    name = f"{source}_{datetime.date.today():%Y%m%d}"
+    return f"{name}_{stable_hash(sorted(jobs))[:8]}" if jobs else name
+
+
+def _run_dir(run_name: str) -> str:
+    path = os.path.join(config.BATCH_DIR, run_name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _state_path(run_dir: str) -> str:
+    return os.path.join(run_dir, "state.json")
+
+
+def load_state(run_name: str) -> dict | None:
+    path = _state_path(os.path.join(config.BATCH_DIR, run_name))
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(run_dir: str, state: dict) -> None:
+    # write-then-rename so a crash never leaves a half-written state file
+    path = _state_path(run_dir)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+# ----------------------------------------------------------------------------
+# Request lines
+# ----------------------------------------------------------------------------
+def _request_line(custom_id: str, stage: str, messages: list, temperature: float, max_tokens: int,
+                  response_format: dict | None = None) -> dict:
+    """A Batch API chat request on the model the live pipeline starts `stage` on (model_for)."""
+    body = {
+        "model": model_for(stage),
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    if response_format:
+        body["response_format"] = response_format
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": body,
+    }
+
+
+def _fit(text: str, max_tokens: int) -> str:
+    """Batch requests can't shrink-and-retry, so trim up front."""
+    return truncate_to_token_limit(text or "", max_tokens, model=config.GPT_MODEL_CHAT)
+
+
+def _input_budget() -> int:
+    return config.GPT_MAX_INPUT_TOKENS - config.GPT_MAX_TOKENS
+
+
+def _insights_lines(jobs: dict, single_pass: bool) -> list[dict]:
+    budget = _input_budget()
+    lines = []
+    for job_id, job in jobs.items():
+        base_info = f"{job['description']}\n{job['content']}\n{job['description_byte']}"
+        extracted = extract_text_from_files(job.get("attachments", []))
+        bi_trim = _fit(base_info, budget // 3)
+        et_trim = _fit(extracted, 2 * budget // 3)
+        if single_pass:
+            lines.append(_request_line(
+                f"insights::{job_id}", "structured",
+                build_structured_analysis_messages(bi_trim, et_trim, config.company_info),
+                config.GPT_TEMPERATURE, config.GPT_SINGLE_PASS_MAX_TOKENS,
+                response_format={"type": "json_object"},
+            ))
+        else:
+            lines.append(_request_line(f"insights::{job_id}", "insights",
+                                       build_insights_messages(bi_trim, et_trim),
+                                       config.GPT_TEMPERATURE, config.GPT_MAX_TOKENS))
+    return lines
+
+
+def _swot_tags_lines(jobs: dict, results: dict, single_pass: bool) -> list[dict]:
+    if single_pass:
+        return []
+    budget = _input_budget()
+    lines = []
+    for job_id, job in jobs.items():
+        insights = results.get(f"insights::{job_id}", "")
+        swot_info = f"{job['description']}\n{insights}\n{job['description_byte']}\n{job['content']}"
+        tags_info = f"{job['description']}\n{insights}\n{job['content']}"
+        lines.append(_request_line(f"swot::{job_id}", "swot",
+                                   build_swot_messages(_fit(swot_info, budget), config.company_info),
+                                   config.GPT_TEMPERATURE, config.GPT_MAX_TOKENS))
+        lines.append(_request_line(f"tags::{job_id}", "tags",
+                                   build_tags_messages(_fit(tags_info, budget)),
+                                   0.5, 256))
+    return lines
+
+
+def _match_articles(state: dict, articles: list[dict] | None) -> dict:
+    """Run the (local) relevance filter for every job whose tags came back."""
+    job_ids = list(state["jobs"])
+    tag_lists = [_analysis_for(job_id, state)["tags"] for job_id in job_ids]
+    if articles is not None:
+        engine, candidates = RelevanceEngine(articles), None
+    else:
+        engine, candidates = RelevanceEngine.for_notices(
+            [(tags, state["jobs"][job_id].get("title", "")) for job_id, tags in zip(job_ids, tag_lists)]
+        )
+    scored_all = engine.relevant_many(
+        [(tags, state["jobs"][job_id]["sol_text"]) for job_id, tags in zip(job_ids, tag_lists)],
+        candidates=candidates,
+    )
+    return {
+        job_id: [
+            {
+                "id": art.get("id"),
+                "title": art["title"],
+                "link": art["link"],
+                "description": art.get("description", ""),
+                "content_text": art.get("content_text") or "",
+                "relevance": round(score, 4),
+            }
+            for art, score in scored
+        ]
+        for job_id, scored in zip(job_ids, scored_all)
+    }
+
+
+def _impact_lines(state: dict) -> list[dict]:
+    lines = []
+    for job_id, matched in state["matches"].items():
+        insights = _analysis_for(job_id, state)["insights"]
+        for n, art in enumerate(matched):
+            lines.append(_request_line(f"impact::{job_id}::{n}", "impact",
+                                       build_news_impact_messages(insights, art, config.company_info),
+                                       0.5, 256))
+    return lines
+
+
+def _tags_for(job_id: str, results: dict):
+    raw = results.get(f"tags::{job_id}")
+    if raw is None or raw.startswith("[BATCH ERROR"):
+        return raw or "[BATCH ERROR: no tags returned]"
+    return parse_tags(raw)
+
+
+def _stage_of(custom_id: str) -> str:
+    return "batch_" + custom_id.split("::", 1)[0]
+
+
+def _job_of(custom_id: str) -> str:
+    return custom_id.split("::")[1]
+
+
+def _analysis_for(job_id: str, state: dict) -> dict:
+    """Row fields (insights, swot, tags, value, value_confidence) for one job."""
+    results = state["results"]
+    raw = results.get(f"insights::{job_id}", "")
+    if state.get("single_pass"):
+        if raw.startswith("[BATCH ERROR"):
+            return structured_to_row_fields(raw)
+        try:
+            return structured_to_row_fields(parse_structured_analysis(raw))
+        except ValueError as e:
+            return structured_to_row_fields(f"[BATCH ERROR: unparsable analysis: {e}]")
+    return {
+        "insights": raw,
+        "swot": results.get(f"swot::{job_id}", ""),
+        "tags": _tags_for(job_id, results),
+        "value": None,
+        "value_confidence": None,
+    }
+
+
+# ----------------------------------------------------------------------------
+# Stage transitions: written -> submitted -> completed -> ingested
+# ----------------------------------------------------------------------------
+def _write_stage(run_dir: str, state: dict, stage: str, lines: list[dict]) -> None:
+    path = os.path.join(run_dir, f"{stage}_input.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+    state["stages"][stage] = {
+        "status": "written" if lines else "ingested",
+        "input": path,
+        "output": os.path.join(run_dir, f"{stage}_output.jsonl"),
+        "requests": len(lines),
+    }
+    _save_state(run_dir, state)
+    print(f"📝 [{stage}] wrote {len(lines)} batch requests → {path}")
+
+
+def _submit_stage(run_dir: str, state: dict, stage: str) -> None:
+    info = state["stages"][stage]
+    if state["endpoint"] == "openai":
+        if not _OPENAI_V1:
+            raise RuntimeError("The Batch API needs openai>=1.x; use endpoint='local' instead.")
+        with open(info["input"], "rb") as f:
+            batch_file = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=config.BATCH_COMPLETION_WINDOW,
+            metadata={"run": state["run_name"], "stage": stage},
+        )
+        info["batch_id"] = batch.id
+        print(f"📤 [{stage}] submitted batch {batch.id}")
+    info["status"] = "submitted"
+    _save_state(run_dir, state)
+
+
+def _local_client():
+    if config.BATCH_LOCAL_BASE_URL and _OPENAI_V1:
+        from openai import OpenAI
+        return OpenAI(base_url=config.BATCH_LOCAL_BASE_URL,
+                      api_key=config.OPENAI_API_KEY or "local")
+    return None
+
+
+def _run_local(info: dict) -> None:
+    """
+    Replay the input file one request at a time, appending to the output file.
+    Already-answered custom_ids are skipped, so this resumes mid-file.
+    """
+    done = set()
+    if os.path.exists(info["output"]):
+        with open(info["output"], "r", encoding="utf-8") as f:
+            done = {json.loads(l)["custom_id"] for l in f if l.strip()}
+
+    local = _local_client()
+    with open(info["input"], "r", encoding="utf-8") as f_in, \
+         open(info["output"], "a", encoding="utf-8") as f_out:
+        for raw in f_in:
+            if not raw.strip():
+                continue
+            req = json.loads(raw)
+            if req["custom_id"] in done:
+                continue
+            body = req["body"]
+            telemetry.set_notice(_job_of(req["custom_id"]))
+            try:
+                if local is not None:
+                    with telemetry.track_call(_stage_of(req["custom_id"]), body["model"],
+                                              provider="local") as rec:
+                        resp = local.chat.completions.create(**body)
+                        rec.usage = telemetry.usage_from_response(resp)
+                    text = resp.choices[0].message.content
+                else:
+                    text = _chat_complete(body["model"], body["messages"],
+                                          body["temperature"], body["max_tokens"],
+                                          response_format=body.get("response_format"),
+                                          stage=_stage_of(req["custom_id"]))
+                out = {"custom_id": req["custom_id"],
+                       "response": {"status_code": 200,
+                                    "body": {"choices": [{"message": {"content": text}}]}},
+                       "error": None}
+            except Exception as e:
+                out = {"custom_id": req["custom_id"], "response": None,
+                       "error": {"message": str(e)}}
+            f_out.write(json.dumps(out, ensure_ascii=False) + "\n")
+            f_out.flush()
+    telemetry.set_notice(None)
+
+
+def _poll_stage(run_dir: str, state: dict, stage: str) -> None:
+    info = state["stages"][stage]
+    if state["endpoint"] != "openai":
+        _run_local(info)
+    else:
+        while True:
+            batch = client.batches.retrieve(info["batch_id"])
+            print(f"⏳ [{stage}] batch {batch.id}: {batch.status}")
+            if batch.status in TERMINAL_BATCH_STATUSES:
+                break
+            time.sleep(config.BATCH_POLL_SECONDS)
+
+        # expired / cancelled batches still return whatever finished
+        with open(info["output"], "w", encoding="utf-8") as f:
+            for file_id in (batch.output_file_id, batch.error_file_id):
+                if file_id:
+                    f.write(client.files.content(file_id).text.rstrip("\n") + "\n")
+        info["batch_status"] = batch.status
+
+    info["status"] = "completed"
+    _save_state(run_dir, state)
+
+
+def _ingest_stage(run_dir: str, state: dict, stage: str) -> None:
+    info = state["stages"][stage]
+    results = state["results"]
+    if os.path.exists(info["output"]):
+        with open(info["output"], "r", encoding="utf-8") as f:
+            for raw in f:
+                if not raw.strip():
+                    continue
+                line = json.loads(raw)
+                resp = line.get("response") or {}
+                # local replays were already recorded call by call in _run_local
+                record = state["endpoint"] == "openai"
+                if record:
+                    telemetry.set_notice(_job_of(line["custom_id"]))
+                if resp.get("status_code") == 200:
+                    content = resp["body"]["choices"][0]["message"]["content"] or ""
+                    results[line["custom_id"]] = content.strip()
+                    if record:
+                        telemetry.record_call(_stage_of(line["custom_id"]), config.GPT_MODEL_CHAT,
+                                              telemetry.usage_from_response(resp["body"]),
+                                              provider="openai-batch")
+                else:
+                    err = (line.get("error") or {}).get("message") or resp.get("body")
+                    results[line["custom_id"]] = f"[BATCH ERROR: {err}]"
+                    if record:
+                        telemetry.record_call(_stage_of(line["custom_id"]), config.GPT_MODEL_CHAT, {},
+                                              outcome="error", error=str(err),
+                                              provider="openai-batch")
+        telemetry.set_notice(None)
+
+    with open(info["input"], "r", encoding="utf-8") as f:
+        for raw in f:
+            if raw.strip():
+                cid = json.loads(raw)["custom_id"]
+                results.setdefault(cid, "[BATCH ERROR: no response]")
+
+    info["status"] = "ingested"
+    _save_state(run_dir, state)
+    print(f"📥 [{stage}] ingested {info['requests']} results")
+
+
+def _advance(run_dir: str, state: dict, stage: str) -> None:
+    """Drive one stage from wherever it stopped to `ingested`."""
+    info = state["stages"][stage]
+    if info["status"] == "written":
+        _submit_stage(run_dir, state, stage)
+    if info["status"] == "submitted":
+        _poll_stage(run_dir, state, stage)
+    if info["status"] == "completed":
+        _ingest_stage(run_dir, state, stage)
+
+
+# ----------------------------------------------------------------------------
+# Driver
+# ----------------------------------------------------------------------------
+def run_batch_pipeline(jobs: dict,
+                       run_name: str,
+                       articles: list[dict] | None = None,
+                       endpoint: str | None = None) -> dict:
+    """
+    Run insights → SWOT/tags → news impacts as three dependent batches.
+
+    :param jobs:     {job_id: {"content", "description", "description_byte",
+                      "attachments", "sol_text", "title"}} — when `run_name` already
+                      exists on disk the stored jobs are resumed; passing a
+                      different set of jobs for it raises ValueError.
+    :param run_name: Folder under config.BATCH_DIR holding the run state.
+    :param articles: RSS articles to match against each job's tags; by
+                      default the recent articles of the vector index.
+    :param endpoint: "openai" or "local"; defaults to config.BATCH_ENDPOINT.
+    :return:         {job_id: {"insights", "swot", "tags", "value",
+                      "value_confidence", "news_impacts"}}
+    """
+    state = load_state(run_name)
+    if state is None and not jobs:
+        print(f"✅ Batch run '{run_name}': no jobs to run")
+        return {}
+    telemetry.start_run(f"batch-{run_name}")
+    run_dir = _run_dir(run_name)
+    if state is None:
+        state = {
+            "run_name": run_name,
+            "endpoint": endpoint or config.BATCH_ENDPOINT,
+            "single_pass": config.GPT_SINGLE_PASS_ANALYSIS,
+            "created": datetime.datetime.utcnow().isoformat(),
+            "jobs": jobs,
+            "stages": {},
+            "results": {},
+        }
+        _save_state(run_dir, state)
+    elif jobs and set(jobs) != set(state["jobs"]):
+        raise ValueError(
+            f"Batch run '{run_name}' holds {len(state['jobs'])} other jobs; "
+            f"use a new run name for these {len(jobs)} jobs"
+        )
+    else:
+        print(f"🔁 Resuming batch run '{run_name}' ({len(state['jobs'])} jobs)")
+
+    jobs = state["jobs"]
+    results = state["results"]
+    single_pass = state.get("single_pass", False)
+
+    if "insights" not in state["stages"]:
+        _write_stage(run_dir, state, "insights", _insights_lines(jobs, single_pass))
+    _advance(run_dir, state, "insights")
+
+    if "swot_tags" not in state["stages"]:
+        _write_stage(run_dir, state, "swot_tags", _swot_tags_lines(jobs, results, single_pass))
+    _advance(run_dir, state, "swot_tags")
+
+    if "impacts" not in state["stages"]:
+        if "matches" not in state:
+            state["matches"] = _match_articles(state, articles)
+            _save_state(run_dir, state)
+        _write_stage(run_dir, state, "impacts", _impact_lines(state))
+    _advance(run_dir, state, "impacts")
+
+    out = {}
+    for job_id in jobs:
+        analysis = _analysis_for(job_id, state)
+        out[job_id] = {
+            **analysis,
+            "news_impacts": [
+                {
+                    "article_title": art["title"],
+                    "article_link": art["link"],
+                    "relevance": art.get("relevance"),
+                    "impact": results.get(f"impact::{job_id}::{n}", ""),
+                }
+                for n, art in enumerate(state["matches"].get(job_id, []))
+            ],
+        }
+        if isinstance(analysis["tags"], list):
+            matched = state["matches"].get(job_id, [])
+            register_notice(job_id, analysis["tags"], jobs[job_id]["sol_text"], analysis["insights"],
+                            jobs[job_id].get("title", ""))
+            record_matches(job_id, [(art, art.get("relevance") or 0.0) for art in matched],
+                           out[job_id]["news_impacts"])
+    print(f"🏁 Batch run '{run_name}' complete ({len(out)} jobs)")
+    telemetry.print_stage_summary()
+    return out
+
+
+if __name__ == "__main__":
+    # Resume / finish a stored run:  python batch_runner.py <run_name>
+    if len(sys.argv) != 2:
+        print("usage: python batch_runner.py <run_name>")
+        sys.exit(1)
+    name = sys.argv[1]
+    if load_state(name) is None:
+        print(f"❌ No batch run named '{name}' under {config.BATCH_DIR}")
+        sys.exit(1)
+    run_batch_pipeline({}, name)
+    for stage, info in load_state(name)["stages"].items():
+        print(f"  {stage:<10} {info['status']:<10} {info['requests']} requests")
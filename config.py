@@ -111,6 +111,43 @@ RAW_OUTPUT_JSON = "raw_api_data_files.json"
 # Database name
 DB_NAME = "rss_data7.db"
 
+# Articles considered for news impacts (SQLite datetime modifier on pub_date)
+ARTICLE_LOOKBACK = "-1 month"
+
+# Embed new articles during rss_pull and store the vectors in the RSS DB
+# (article_vectors table, see article_index.py)
+INDEX_ARTICLES_AT_INGEST = True
+
+# After an ingest, match only the new articles against the notices analysed
+# in the last NOTICE_OPEN_DAYS days (notice_registry, see notice_matches.py)
+INCREMENTAL_NEWS_MATCHING = True
+NOTICE_OPEN_DAYS = 30
+
+# Topic-tag new articles during rss_pull (rss_articles.tags): one chat call per
+# ARTICLE_TAG_BATCH articles, each cut to ARTICLE_TAG_MAX_TOKENS
+TAG_ARTICLES_AT_INGEST = True
+ARTICLE_TAG_BATCH = 20
+ARTICLE_TAG_MAX_TOKENS = 300
+ARTICLE_TAG_WORKERS = 4
+# Before any embedding work, drop articles whose tags share fewer than
+# TAG_OVERLAP_MIN words with the notice tags (untagged articles always pass)
+ARTICLE_TAG_PREFILTER = True
+TAG_OVERLAP_MIN = 1
+
+# Per notice, only the BM25_CANDIDATES best full-text (FTS5/BM25) matches for
+# its tags and title are loaded and scored, instead of the whole window
+BM25_RETRIEVAL = True
+BM25_CANDIDATES = 200
+
+# Collapse near-duplicate articles (the same story under several section feeds,
+# syndicated copies with other GUIDs) at ingest: 64-bit SimHash of the body,
+# at most NEAR_DUPLICATE_MAX_BITS differing bits joins an existing cluster.
+# Only one article per cluster is embedded, tagged, scored and given an impact.
+# Edited copies (a changed word, an added or dropped sentence) differ by 2-8
+# bits; distinct articles in the feeds are 14 bits or more apart.
+CLUSTER_NEAR_DUPLICATES = True
+NEAR_DUPLICATE_MAX_BITS = 8
+
 # Namespace used for <content:encoded> in the RSS feeds
 XML_NAMESPACES = {
     "content": "http://purl.org/rss/1.0/modules/content/"
@@ -123,6 +160,17 @@ XML_NAMESPACES = {
 # Cosine similarity threshold for determining if an article is relevant
 RELEVANCE_THRESHOLD = 0.745
 
+# Minimum TF-IDF cosine (solicitation vs. article, IDF fitted over the article
+# corpus) an article needs before its embedding score counts
+LOCAL_PREFILTER_THRESHOLD = 0.05
+
+# News impacts: only the best-scoring relevant articles per notice get an
+# impact paragraph; those calls run concurrently
+NEWS_IMPACT_TOP_K = 5
+NEWS_IMPACT_WORKERS = 5
+# Token budget for the article body (plain text) in each impact prompt
+NEWS_IMPACT_ARTICLE_TOKENS = 800
+
 # Max characters to keep when truncating text for GPT prompts
 MAX_CHARS = 4000
 GPT_MODEL_CHAT = "gpt-4.1-mini"         # or "gpt-4" / "gpt-3.5-turbo" depending on your usage
@@ -135,6 +183,80 @@ GPT_MAX_INPUT_TOKENS = 123000
 GPT_TEMPERATURE = 0.7
 GPT_MAX_TOKENS = 1024
 
+# One JSON call (summary, timeline, valuation, action plan, SWOT, tags, value)
+# instead of separate insights / SWOT / tags calls.
+GPT_SINGLE_PASS_ANALYSIS = False
+GPT_SINGLE_PASS_MAX_TOKENS = 2048
+
+# Map-reduce summarisation: attachment text longer than the trigger is split
+# into chunks, each chunk summarised (in parallel, cached by content hash) and
+# the summaries replace the raw text in the insights prompt.
+GPT_MAP_REDUCE = True
+MAP_REDUCE_TRIGGER_TOKENS = 90_000
+MAP_REDUCE_CHUNK_TOKENS = 6_000
+MAP_REDUCE_MAX_CHUNKS = 40          # caps cost: chunks grow instead of multiplying
+MAP_REDUCE_SUMMARY_TOKENS = 600
+MAP_REDUCE_WORKERS = 6
+
+
+# ------------------------------------------------------------------------------
+# 7a) RATE LIMITS (used by llm_scheduler.py)
+# ------------------------------------------------------------------------------
+# Per-model request/token budgets per minute. Set these to your account tier;
+# "default" applies to any model not listed.
+LLM_RATE_LIMITS = {
+    "default":                {"rpm": 500,  "tpm": 200_000},
+    "gpt-4.1-nano":           {"rpm": 5000, "tpm": 2_000_000},
+    "gpt-4.1-mini":           {"rpm": 5000, "tpm": 2_000_000},
+    "gpt-4.1":                {"rpm": 5000, "tpm": 800_000},
+    "gpt-4o":                 {"rpm": 5000, "tpm": 800_000},
+    "gpt-4":                  {"rpm": 500,  "tpm": 10_000},
+    "text-embedding-3-small": {"rpm": 5000, "tpm": 5_000_000},
+}
+LLM_MAX_CONCURRENCY = 8     # upper bound; adapts downward on 429s
+LLM_MAX_RETRIES = 8
+
+
+# ------------------------------------------------------------------------------
+# 7b) OFFLINE BATCH MODE
+# ------------------------------------------------------------------------------
+# Working directory for batch runs (one sub-folder per run: JSONL inputs/outputs
+# plus a state.json so every step can be resumed after an interruption).
+BATCH_DIR = "batch_runs"
+# "openai" submits to the Batch API; "local" replays each line against a
+# chat-completions endpoint (BATCH_LOCAL_BASE_URL, or the default client).
+BATCH_ENDPOINT = "openai"
+BATCH_LOCAL_BASE_URL = os.getenv("BATCH_LOCAL_BASE_URL", "")
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_SECONDS = 60
+
+
+# ------------------------------------------------------------------------------
+# 7c) MODEL ROUTING (used by model_router.py)
+# ------------------------------------------------------------------------------
+# Each stage runs on the first tier of its cascade and escalates to the next
+# only when the output fails validation (unparsable / implausible tags, empty
+# impact paragraph, invalid JSON). Stages not listed use "default".
+MODEL_CASCADE = True
+MODEL_TIERS = {
+    "fast":     "gpt-4.1-nano",
+    "standard": GPT_MODEL_CHAT,
+    "large":    "gpt-4.1",
+}
+STAGE_MODEL_CASCADE = {
+    "default":        ["standard"],
+    "tags":           ["fast", "standard"],
+    "article_domain": ["fast", "standard"],
+    "article_tags":   ["fast", "standard"],
+    "article_batch_tags": ["fast", "standard"],
+    "impact":         ["fast", "standard"],
+    "structured":     ["standard", "large"],
+    "competitor":     ["large"],
+    "trend":          ["large"],
+}
+# Also escalate a single-pass analysis whose value_confidence comes back "low".
+CASCADE_ESCALATE_LOW_CONFIDENCE = False
+
 
 #8) SAM SETTINGS
 SAM_SEARCH_KEYWORDS = ["VIPR I-BPA for Incident Base"]
@@ -145,4 +267,28 @@ DATA_PATH = ROOT / "combined_results_fire1.json"
 
 DB_PATH = ROOT / "bid_ally.db"
 
+# Persistent cache for LLM / web-API results (llm_cache.py)
+CACHE_DB_PATH = ROOT / "llm_cache.db"
+# In-process LRU of embedding vectors in front of the persistent cache
+# (float32, ~6 KB per 1536-dim vector)
+EMBED_LRU_SIZE = 20_000
+# Embedding requests: inputs per request and total tokens per request
+# (API limits are 2048 inputs / 300k tokens), and per-input token cap
+EMBED_BATCH_MAX_ITEMS = 2048
+EMBED_BATCH_MAX_TOKENS = 250_000
+EMBED_MAX_INPUT_TOKENS = 8191
+
+# Per-call ledger of LLM / Perplexity calls (telemetry.py); report with
+# `python telemetry.py` or the "LLM Telemetry" dashboard tab
+TELEMETRY_DB_PATH = ROOT / "telemetry.db"
+TELEMETRY_LEDGER = True
+
+# Award Insights: Perplexity competitor profiles are cached per recipient
+# (UEI, else name) in the LLM cache for this many days.
+COMPETITOR_PROFILE_TTL_DAYS = 30
+# Perplexity year summaries (trend insight): closed years are cached forever,
+# the current year is refreshed after this many hours.
+YEAR_INSIGHT_CURRENT_TTL_HOURS = 24
+PERPLEXITY_MAX_WORKERS = 5
+
 PERPLEXITY_KEY = "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"
\ No newline at end of file
@@ -6,6 +6,7 @@ from pathlib import Path
 from overview_full import render_overview
 from single_solicitation_view import render_single_solicitation
 from award_insights_view import render_award_insights
+from telemetry_view import render_telemetry
 
 
 # ────────────────────────────────────────────────────────────────────────────
@@ -63,7 +64,7 @@ st.markdown("""
 
 mode = st.sidebar.radio(
     "Mode",
-    ["Overview", "Single Solicitation", "Award Insights"]
+    ["Overview", "Single Solicitation", "Award Insights", "LLM Telemetry"]
 ,
     index=0
 )
@@ -80,3 +81,6 @@ elif mode == "Single Solicitation":
 
 elif mode == "Award Insights":
     render_award_insights()
+
+elif mode == "LLM Telemetry":
+    render_telemetry()
@@ -2,9 +2,17 @@
 
 import config
 from file_utils import extract_text_from_files, truncate_to_token_limit
+from llm_scheduler import get_scheduler, estimate_chat_tokens, count_tokens
+from llm_cache import cache_get, cache_put, stable_hash
+import telemetry
+from model_router import model_for, run_cascade, plausible_tags, plausible_paragraph
 import os
+import re
 import json
 import time
+import hashlib
+import datetime
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import requests
 
@@ -14,7 +22,8 @@ import requests
 try:
     # New SDK (v1.x)
     from openai import OpenAI, RateLimitError, BadRequestError
-    client = OpenAI(api_key=config.OPENAI_API_KEY)
+    # retries are owned by llm_scheduler, not the SDK
+    client = OpenAI(api_key=config.OPENAI_API_KEY, max_retries=0)
     _OPENAI_V1 = True
 
     # Provide legacy name for downstream code that expects InvalidRequestError
@@ -29,33 +38,311 @@ except Exception:
     _OPENAI_V1 = False
 
 
-def _chat_complete(model: str, messages: list, temperature: float, max_tokens: int) -> str:
-    """Uniform chat completion wrapper for both SDKs."""
-    if _OPENAI_V1:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-        return resp.choices[0].message.content
-    else:
-        resp = openai.ChatCompletion.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-        return resp["choices"][0]["message"]["content"]
+def _chat_complete(model: str, messages: list, temperature: float, max_tokens: int,
+                   response_format: dict | None = None, stage: str = "other",
+                   on_text=None) -> str:
+    """
+    Uniform chat completion wrapper for both SDKs, paced by llm_scheduler.
+    Each call (tokens incl. prefix-cache hits, latency, retries, outcome) is
+    recorded by telemetry under `stage`.
+
+    If `on_text` is given the reply is streamed and `on_text(text_so_far)` is
+    called as tokens arrive (cumulative, so a retried call simply restarts).
+    """
+    extra = {"response_format": response_format} if response_format else {}
+
+    def _call_streaming():
+        parts = []
+        if _OPENAI_V1:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+                **extra,
+            )
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    rec.usage = telemetry.usage_from_response(chunk)
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    on_text("".join(parts))
+        else:
+            stream = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **extra,
+            )
+            for chunk in stream:
+                delta = chunk["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    on_text("".join(parts))
+        return "".join(parts)
+
+    def _call():
+        if on_text is not None:
+            return _call_streaming()
+        if _OPENAI_V1:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **extra,
+            )
+            text = resp.choices[0].message.content
+        else:
+            resp = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **extra,
+            )
+            text = resp["choices"][0]["message"]["content"]
+        rec.usage = telemetry.usage_from_response(resp)
+        return text
+
+    with telemetry.track_call(stage, model) as rec:
+        return get_scheduler(model).run(_call, estimate_chat_tokens(messages, max_tokens),
+                                        on_retry=rec.on_retry)
+
+
+# ---------- prompt builders ---------------------------------------------
+# Each builder returns the `messages` list for one stage, so the interactive
+# helpers below and the offline batch runner send byte-identical prompts.
+#
+# Layout is chosen for provider-side prefix caching: a system message that is
+# identical for every stage (persona + company profile), then the stage's fixed
+# instructions, and only then the per-solicitation material.  Everything up to
+# the "---" marker is the same bytes on every call of a stage.
+_ANALYST_SYSTEM = (
+    "You are a senior government-contracting analyst and strategic advisor. "
+    "You assess procurement opportunities, bid strategy and market news on behalf "
+    "of the company profiled below. Be specific and avoid generic statements."
+)
+
+_INSIGHTS_INSTRUCTIONS = """Task: procurement insights.
+Given the bid information extracted from government procurement documents below, provide:
+1. A concise top level summary of the bid.
+2. A timeline to accomplish the requirements.
+3. An estimated valuation of the contract.
+4. An action plan with estimated man‑hours."""
+
+_SWOT_INSTRUCTIONS = """Task: SWOT analysis.
+Using the company profile above and the solicitation/bid details plus preliminary insights below,
+provide a concise but thorough SWOT analysis."""
+
+_TAGS_INSTRUCTIONS = """Task: topic tags.
+Generate 3‑5 short, specific keyword tags (comma‑separated) for the solicitation below.
+Reply with the tags only."""
+
+_NEWS_IMPACT_INSTRUCTIONS = """Task: news impact.
+Assess how the recent news article below might impact the performance or outcome of the
+government contract described by the solicitation insights. Provide 3-4 brief and concise bullet
+points on how the event/news could positively or negatively affect the company's performance if
+they secure this bid."""
+
+_STRUCTURED_INSTRUCTIONS = """Task: structured procurement analysis.
+Given the bid information extracted from government procurement documents below, analyse the
+opportunity for the company and reply with ONE JSON object using exactly these keys:
+  "summary":          concise top level summary of the bid (string)
+  "timeline":         timeline to accomplish the requirements (string)
+  "valuation":        estimated valuation of the contract, with the reasoning (string)
+  "value":            best point estimate of the total contract value in USD (number, or null if it cannot be estimated)
+  "value_confidence": "high", "medium" or "low"
+  "action_plan":      action plan with estimated man‑hours (string)
+  "swot":             {"strengths": [...], "weaknesses": [...], "opportunities": [...], "threats": [...]}
+  "tags":             3‑5 short, specific keyword tags (array of strings)"""
+
+_CHUNK_SUMMARY_INSTRUCTIONS = """Task: solicitation excerpt summary.
+The text below is one part of a larger government solicitation package. Summarise it as terse
+bullet points, keeping every requirement, deliverable, quantity, location, date/deadline,
+period of performance, evaluation criterion, pricing/CLIN detail and contract value it mentions.
+Omit boilerplate clauses. If the part contains nothing substantive, reply "No substantive content." """
+
+_CHART_INSTRUCTIONS = """Task: award-chart insight.
+Analyse the historical federal award chart data below and provide a strategic 2–4 sentence insight
+for the company. Focus on competitive positioning, opportunities, or warnings based on the data."""
+
+_COMPETITOR_INSTRUCTIONS = """Task: competitor positioning.
+Below are the top recipients of federal awards in the company's NAICS code, with web-based summaries
+of each. Based on this information:
+- Recommend whether the company should target or avoid competing with any of these companies.
+- Explain which competitors represent threats vs. opportunities.
+- Suggest a clear positioning strategy that exploits unique advantages or avoids vulnerable areas.
+Be candid, strategic, and insightful. Focus on specifics where possible."""
+
+_TREND_INSTRUCTIONS = """Task: multi-year spending trend insight.
+Analyse the multi-year federal award totals and web context below and generate a detailed,
+strategic insight that includes:
+- Real explanations for peaks or declines in award values
+- Specific agency or program shifts if relevant
+- Opportunities and risks based on recent policy or market moves
+- Recommendations for the company's positioning
+Be specific. Avoid generic boilerplate."""
+
+
+def _company_block(company_details: dict | None) -> str:
+    # sort_keys keeps the serialisation byte-identical across calls
+    return json.dumps(company_details if company_details is not None else config.company_info,
+                      indent=2, sort_keys=True, ensure_ascii=False)
+
+
+def _prefixed_messages(company_details: dict | None, instructions: str, variable: str) -> list[dict]:
+    return [
+        {"role": "system",
+         "content": f"{_ANALYST_SYSTEM}\n\nCompany Profile:\n{_company_block(company_details)}"},
+        {"role": "user", "content": f"{instructions}\n\n---\n{variable}"},
+    ]
+
+
+def build_insights_messages(base_info: str, extracted_text: str,
+                            company_details: dict | None = None) -> list[dict]:
+    variable = (f"Contextual Information:\n{base_info}\n\n"
+                f"Attachments Extracted Text:\n{extracted_text}")
+    return _prefixed_messages(company_details, _INSIGHTS_INSTRUCTIONS, variable)
+
+
+def build_swot_messages(base_info: str, company_details: dict) -> list[dict]:
+    variable = f"Solicitation/Bid Details + Preliminary Insights:\n{base_info}"
+    return _prefixed_messages(company_details, _SWOT_INSTRUCTIONS, variable)
+
+
+def build_tags_messages(base_info: str, company_details: dict | None = None) -> list[dict]:
+    return _prefixed_messages(company_details, _TAGS_INSTRUCTIONS, base_info)
+
+
+def parse_tags(content_out: str) -> list[str]:
+    """Split a comma-separated tag reply into a clean list."""
+    return [t.strip() for t in content_out.split(",") if t.strip()]
+
+
+def build_news_impact_messages(insights: str, article: dict, company_details: dict) -> list[dict]:
+    variable = (f"Solicitation Insights:\n{insights}\n\n"
+                f"News Article:\n"
+                f"Title: {article.get('title', '')}\n"
+                f"Description: {article.get('description', '')}\n"
+                f"Content: {truncate_to_token_limit(article.get('content_text') or '', config.NEWS_IMPACT_ARTICLE_TOKENS)}")
+    return _prefixed_messages(company_details, _NEWS_IMPACT_INSTRUCTIONS, variable)
+
+
+def build_structured_analysis_messages(base_info: str,
+                                      extracted_text: str,
+                                      company_details: dict) -> list[dict]:
+    variable = (f"Contextual Information:\n{base_info}\n\n"
+                f"Attachments Extracted Text:\n{extracted_text}")
+    return _prefixed_messages(company_details, _STRUCTURED_INSTRUCTIONS, variable)
+
+
+def build_chunk_summary_messages(chunk: str, company_details: dict | None = None) -> list[dict]:
+    return _prefixed_messages(company_details, _CHUNK_SUMMARY_INSTRUCTIONS, chunk)
+
+
+# ---------- 0.  MAP-REDUCE FOR OVERSIZED PACKAGES -------------------------
+def _split_chunks(text: str, chunk_tokens: int) -> list[str]:
+    """
+    Content-defined chunking: paragraphs are packed into chunks, and a chunk
+    may only close on a paragraph whose hash marks it as a boundary (or when
+    it is full).  An amendment that edits a few pages therefore changes only
+    the chunks around the edit, and every other chunk keeps its hash.
+    """
+    paragraphs = [p for p in re.split(r"\n\s*\n", text) if p.strip()]
+    chunks, current, current_tokens = [], [], 0
+
+    def _close():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n\n".join(current))
+        current, current_tokens = [], 0
+
+    for para in paragraphs:
+        tokens = count_tokens(para)
+        if tokens > chunk_tokens:
+            # oversized paragraph: hard-split on lines
+            _close()
+            buf, buf_tokens = [], 0
+            for line in para.splitlines():
+                lt = count_tokens(line)
+                if buf and buf_tokens + lt > chunk_tokens:
+                    chunks.append("\n".join(buf))
+                    buf, buf_tokens = [], 0
+                buf.append(line[: chunk_tokens * 4])
+                buf_tokens += lt
+            if buf:
+                chunks.append("\n".join(buf))
+            continue
+
+        if current and current_tokens + tokens > chunk_tokens:
+            _close()
+        current.append(para)
+        current_tokens += tokens
+        is_anchor = int(hashlib.md5(para.encode("utf-8")).hexdigest(), 16) % 8 == 0
+        if is_anchor and current_tokens >= chunk_tokens // 2:
+            _close()
+    _close()
+    return chunks
+
+
+def _summarize_chunk(chunk: str) -> str:
+    model = model_for("chunk_summary")
+    key = stable_hash(model, _CHUNK_SUMMARY_INSTRUCTIONS, chunk)
+    cached = cache_get("chunk_summary", key)
+    if cached is not None:
+        return cached
+    summary = _chat_complete(
+        model=model,
+        messages=build_chunk_summary_messages(chunk),
+        temperature=0.2,
+        max_tokens=config.MAP_REDUCE_SUMMARY_TOKENS,
+        stage="chunk_summary",
+    ).strip()
+    cache_put("chunk_summary", key, summary)
+    return summary
+
+
+def condense_attachment_text(extracted_text: str) -> str:
+    """
+    Return `extracted_text` unchanged when it fits, otherwise the map step's
+    per-chunk summaries joined in document order (the reduce step is the
+    insights prompt that consumes them).
+    """
+    total = count_tokens(extracted_text)
+    if not config.GPT_MAP_REDUCE or total <= config.MAP_REDUCE_TRIGGER_TOKENS:
+        return extracted_text
+
+    # bounded cost: past MAX_CHUNKS the chunks get bigger, in whole multiples of
+    # the base size so small edits don't reshuffle every chunk boundary
+    base = config.MAP_REDUCE_CHUNK_TOKENS
+    multiple = -(-total // (base * config.MAP_REDUCE_MAX_CHUNKS))
+    chunks = _split_chunks(extracted_text, base * max(1, multiple))
+    print(f"🧩 Map-reduce: {total} tokens → {len(chunks)} chunks")
+
+    with ThreadPoolExecutor(max_workers=config.MAP_REDUCE_WORKERS) as pool:
+        summaries = list(pool.map(telemetry.bind(_summarize_chunk), chunks))
+
+    return "\n\n".join(
+        f"[Part {i}/{len(chunks)} summary]\n{summary}"
+        for i, summary in enumerate(summaries, 1)
+    )
 
 
 # ---------- 1.  INSIGHTS -------------------------------------------------
 def generate_insights(content: str,
                       description: str,
                       description_byte: str,
-                      pdf_files: list[str]) -> str:
+                      pdf_files: list[str],
+                      on_text=None) -> str:
     """
     GPT insights with hard cap on internal retries to prevent infinite loop.
+    Pass `on_text` to receive the reply as it streams in.
     """
     import tiktoken
 
@@ -65,38 +352,21 @@ def generate_insights(content: str,
     enc = tiktoken.get_encoding("cl100k_base")
 
     base_info = f"{description}\n{content}\n{description_byte}"
-    extracted_text = extract_text_from_files(pdf_files)
+    extracted_text = condense_attachment_text(extract_text_from_files(pdf_files))
 
     while reduction_pct > 0.05 and step < MAX_INTERNAL_RETRIES:
         step += 1
         bi_trim = base_info[: int(len(base_info) * reduction_pct)]
         et_trim = extracted_text[: int(len(extracted_text) * reduction_pct)]
 
-        prompt = f"""
-        Given the following bid information extracted from government procurement documents, provide:
-        1. A concise top level summary of the bid.
-        2. A timeline to accomplish the requirements.
-        3. An estimated valuation of the contract.
-        4. An action plan with estimated man‑hours.
-
-        ---
-        Contextual Information:
-        {bi_trim}
-
-        Attachments Extracted Text:
-        {et_trim}
-        """
-
         try:
             content_out = _chat_complete(
-                model=config.GPT_MODEL_CHAT,
-                messages=[
-                    {"role": "system",
-                     "content": "You are a contract analyst providing structured procurement insights."},
-                    {"role": "user", "content": prompt}
-                ],
+                model=model_for("insights"),
+                messages=build_insights_messages(bi_trim, et_trim),
                 temperature=config.GPT_TEMPERATURE,
-                max_tokens=config.GPT_MAX_TOKENS
+                max_tokens=config.GPT_MAX_TOKENS,
+                stage="insights",
+                on_text=on_text,
             )
             return content_out.strip()
 
@@ -119,7 +389,8 @@ def generate_swot_analysis(content: str,
                            description: str,
                            description_byte: str,
                            insights: str,
-                           company_details: dict) -> str:
+                           company_details: dict,
+                           on_text=None) -> str:
     """
     GPT SWOT with capped internal retries.
     """
@@ -135,25 +406,14 @@ def generate_swot_analysis(content: str,
         step += 1
         bi_trim = base_info[: int(len(base_info) * reduction_pct)]
 
-        prompt = f"""
-        You are a strategic consultant. The following data includes:
-        - Company Info: {company_details}
-        - Solicitation/Bid Details + Preliminary Insights:
-          {bi_trim}
-
-        Provide a concise but thorough SWOT analysis.
-        """
-
         try:
             content_out = _chat_complete(
-                model=config.GPT_MODEL_CHAT,
-                messages=[
-                    {"role": "system",
-                     "content": "You are a strategic advisor focusing on SWOT analyses for bid opportunities."},
-                    {"role": "user", "content": prompt}
-                ],
+                model=model_for("swot"),
+                messages=build_swot_messages(bi_trim, company_details),
                 temperature=config.GPT_TEMPERATURE,
-                max_tokens=config.GPT_MAX_TOKENS
+                max_tokens=config.GPT_MAX_TOKENS,
+                stage="swot",
+                on_text=on_text,
             )
             return content_out.strip()
 
@@ -186,24 +446,19 @@ def generate_solicitation_tags(content: str,
         step += 1
         bi_trim = base_info[: int(len(base_info) * reduction_pct)]
 
-        prompt = f"""
-        Generate 3‑5 short, specific keyword tags (comma‑separated) for this solicitation:
-        ---
-        {bi_trim}
-        """
-
         try:
-            content_out = _chat_complete(
-                model=config.GPT_MODEL_CHAT,
-                messages=[
-                    {"role": "system",
-                     "content": "You specialize in extracting relevant topic tags from text."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.5,
-                max_tokens=256
+            # cheap model first; escalate if the reply doesn't look like tags
+            return run_cascade(
+                "tags",
+                lambda model: parse_tags(_chat_complete(
+                    model=model,
+                    messages=build_tags_messages(bi_trim),
+                    temperature=0.5,
+                    max_tokens=256,
+                    stage="tags",
+                )),
+                validate=plausible_tags,
             )
-            return [t.strip() for t in content_out.split(",") if t.strip()]
 
         except (InvalidRequestError, RateLimitError) as e:
             err = str(e).lower()
@@ -215,6 +470,128 @@ def generate_solicitation_tags(content: str,
     raise InvalidRequestError("too_many_retries in generate_solicitation_tags")
 
 
+# ---------- 4.  SINGLE-PASS STRUCTURED ANALYSIS ---------------------------
+def parse_structured_analysis(raw: str) -> dict:
+    """
+    Parse and normalise the JSON reply of the single-pass prompt.
+    Raises ValueError if the reply isn't a JSON object.
+    """
+    text = raw.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("structured analysis is not a JSON object")
+
+    value = data.get("value")
+    if isinstance(value, str):
+        value = value.replace("$", "").replace(",", "").strip()
+    try:
+        value = float(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        value = None
+
+    confidence = str(data.get("value_confidence") or "").strip().lower()
+    tags = data.get("tags") or []
+    if isinstance(tags, str):
+        tags = parse_tags(tags)
+
+    swot = data.get("swot") or {}
+    return {
+        "summary": str(data.get("summary", "")).strip(),
+        "timeline": str(data.get("timeline", "")).strip(),
+        "valuation": str(data.get("valuation", "")).strip(),
+        "value": value,
+        "value_confidence": confidence if confidence in ("high", "medium", "low") else None,
+        "action_plan": str(data.get("action_plan", "")).strip(),
+        "swot": swot if isinstance(swot, dict) else {"summary": str(swot)},
+        "tags": [str(t).strip() for t in tags if str(t).strip()],
+    }
+
+
+def generate_structured_analysis(content: str,
+                                 description: str,
+                                 description_byte: str,
+                                 pdf_files: list[str],
+                                 company_details: dict) -> dict:
+    """
+    One GPT call returning summary, timeline, valuation, action plan, SWOT and
+    tags as JSON, instead of three calls that each resend the attachments.
+    """
+    MAX_INTERNAL_RETRIES = 3
+    reduction_pct = 1.0
+    step = 0
+
+    base_info = f"{description}\n{content}\n{description_byte}"
+    extracted_text = condense_attachment_text(extract_text_from_files(pdf_files))
+
+    while reduction_pct > 0.05 and step < MAX_INTERNAL_RETRIES:
+        step += 1
+        bi_trim = base_info[: int(len(base_info) * reduction_pct)]
+        et_trim = extracted_text[: int(len(extracted_text) * reduction_pct)]
+
+        try:
+            # invalid JSON (or, if configured, a low-confidence valuation)
+            # escalates to the next model tier
+            return run_cascade(
+                "structured",
+                lambda model: parse_structured_analysis(_chat_complete(
+                    model=model,
+                    messages=build_structured_analysis_messages(bi_trim, et_trim, company_details),
+                    temperature=config.GPT_TEMPERATURE,
+                    max_tokens=config.GPT_SINGLE_PASS_MAX_TOKENS,
+                    response_format={"type": "json_object"},
+                    stage="structured",
+                )),
+                validate=lambda a: not (config.CASCADE_ESCALATE_LOW_CONFIDENCE
+                                        and a["value_confidence"] == "low"),
+            )
+
+        except (InvalidRequestError, RateLimitError) as e:
+            err = str(e).lower()
+            if ("maximum context length" in err or "request too large" in err):
+                reduction_pct *= 0.8
+                _log_trunc("structured", step, reduction_pct, bi_trim, et_trim, err)
+                continue
+            raise
+
+    raise InvalidRequestError("too_many_retries in generate_structured_analysis")
+
+
+def structured_to_row_fields(analysis) -> dict:
+    """
+    Map a structured analysis onto the existing row fields
+    (insights / swot / tags) plus numeric value / value_confidence.
+    An error string (from a failed call) is passed through unchanged.
+    """
+    if not isinstance(analysis, dict):
+        return {"insights": analysis, "swot": analysis, "tags": analysis,
+                "value": None, "value_confidence": None}
+
+    insights = "\n\n".join(
+        f"**{heading}**\n{analysis[key]}"
+        for heading, key in (("Summary", "summary"),
+                             ("Timeline", "timeline"),
+                             ("Estimated Valuation", "valuation"),
+                             ("Action Plan", "action_plan"))
+        if analysis.get(key)
+    )
+
+    swot_parts = []
+    for heading, items in analysis["swot"].items():
+        if isinstance(items, list):
+            items = "\n".join(f"- {i}" for i in items)
+        swot_parts.append(f"**{str(heading).capitalize()}**\n{items}")
+
+    return {
+        "insights": insights,
+        "swot": "\n\n".join(swot_parts),
+        "tags": analysis["tags"],
+        "value": analysis["value"],
+        "value_confidence": analysis["value_confidence"],
+    }
+
+
 # ---------- helper to log truncation attempts ---------------------------
 def _log_trunc(label: str, step: int, pct: float, base_sample: str, txt_sample: str, err: str):
     os.makedirs("truncated_logs", exist_ok=True)
@@ -229,41 +606,71 @@ def _log_trunc(label: str, step: int, pct: float, base_sample: str, txt_sample:
         }, f, indent=2, ensure_ascii=False)
 
 
+def _impact_key(insights: str, article: dict, company_details: dict) -> str:
+    article_ref = article.get("id") or article.get("link") or article.get("title", "")
+    return f"{article_ref}:{stable_hash(insights)}:{stable_hash(company_details)}"
+
+
 def generate_news_impact_paragraph(insights: str,
                                    article: dict,
-                                   company_details: dict) -> str:
+                                   company_details: dict,
+                                   on_text=None) -> str:
     """
     If an article is relevant, call GPT for a short paragraph explaining
     how this news might impact the company's performance if they secure the bid.
+    Paragraphs are cached per (article, insights, company profile).
     """
-    prompt = f"""
-    You are an analyst assessing how a recent news article might impact the performance or outcome
-    of a government contract. Here is the data:
-
-    Company Info: {company_details}
-
-    Solicitation Insights:
-    {insights}
+    key = _impact_key(insights, article, company_details)
+    cached = cache_get("news_impact", key)
+    if cached is not None:
+        if on_text is not None:
+            on_text(cached)
+        return cached
+
+    impact = run_cascade(
+        "impact",
+        lambda model: _chat_complete(
+            model=model,
+            messages=build_news_impact_messages(insights, article, company_details),
+            temperature=0.5,
+            max_tokens=256,
+            stage="impact",
+            on_text=on_text,
+        ).strip(),
+        validate=plausible_paragraph,
+    )
+    if plausible_paragraph(impact):
+        cache_put("news_impact", key, impact)
+    return impact
 
-    News Article:
-    Title: {article.get('title', '')}
-    Description: {article.get('description', '')}
-    Content: {article.get('content', '')}
 
-    Please provide a 3-4 brief and concise bullet points on how the event/news in this article could positively or negatively
-    affect the company's performance if they secure this bid.
+def generate_news_impacts(insights: str,
+                          scored_articles: list[tuple[dict, float]],
+                          company_details: dict,
+                          generate=None) -> list[dict]:
+    """
+    news_impacts rows for the (article, score) pairs of RelevanceEngine.relevant,
+    generated concurrently (config.NEWS_IMPACT_WORKERS) and returned in the
+    same order.  `generate(n, article)` replaces the plain
+    generate_news_impact_paragraph call so callers can add retries/streaming.
     """
+    if generate is None:
+        generate = lambda n, article: generate_news_impact_paragraph(insights, article, company_details)
+    generate = telemetry.bind(generate)
 
-    content_out = _chat_complete(
-        model=config.GPT_MODEL_CHAT,
-        messages=[
-            {"role": "system", "content": "You are an expert in analyzing the impact of current events on bids."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.5,
-        max_tokens=256
-    )
-    return content_out.strip()
+    with ThreadPoolExecutor(max_workers=config.NEWS_IMPACT_WORKERS) as pool:
+        futures = [pool.submit(generate, n, art) for n, (art, _) in enumerate(scored_articles)]
+        paragraphs = [f.result() for f in futures]
+
+    return [
+        {
+            "article_title": art["title"],
+            "article_link": art["link"],
+            "relevance": round(score, 4),
+            "impact": paragraph,
+        }
+        for (art, score), paragraph in zip(scored_articles, paragraphs)
+    ]
 
 
 def generate_chart_insight(chart_data: pd.DataFrame, chart_type: str, company_details: dict) -> str:
@@ -273,30 +680,16 @@ def generate_chart_insight(chart_data: pd.DataFrame, chart_type: str, company_de
     try:
         csv_sample = chart_data.head(20).to_csv(index=False)
 
-        prompt = f"""
-        You are a federal contract strategist analyzing historical award data to generate insights for a company.
-
-        Company Information:
-        {json.dumps(company_details, indent=2)}
-
-        Chart Type:
-        {chart_type}
-
-        Chart Data (CSV Format):
-        {csv_sample}
-
-        Based on this information, provide a strategic 2–4 sentence insight for the company.
-        Focus on competitive positioning, opportunities, or warnings based on the data.
-        """
-
         content_out = _chat_complete(
-            model=config.GPT_MODEL_CHAT,
-            messages=[
-                {"role": "system", "content": "You are a strategic analyst for government contracts."},
-                {"role": "user", "content": prompt}
-            ],
+            model=model_for("chart"),
+            messages=_prefixed_messages(
+                company_details,
+                _CHART_INSTRUCTIONS,
+                f"Chart Type:\n{chart_type}\n\nChart Data (CSV Format):\n{csv_sample}",
+            ),
             temperature=0.5,
-            max_tokens=300
+            max_tokens=300,
+            stage="chart",
         )
         return content_out.strip()
 
@@ -304,6 +697,15 @@ def generate_chart_insight(chart_data: pd.DataFrame, chart_type: str, company_de
         return f"[Insight generation failed: {e}]"
 
 
+def _perplexity_chat(data: dict, headers: dict, stage: str) -> str:
+    """POST one Perplexity chat request and return the reply, recording it in telemetry."""
+    with telemetry.track_call(stage, data["model"], provider="perplexity") as rec:
+        response = requests.post("https://api.perplexity.ai/chat/completions", headers=headers, json=data)
+        body = response.json()
+        rec.usage = telemetry.usage_from_response(body)
+        return body["choices"][0]["message"]["content"]
+
+
 def fetch_perplexity_summary(company_name: str, perplexity_key: str) -> str:
     """
     Query the Perplexity API to get a company overview with government contracting focus.
@@ -323,63 +725,100 @@ def fetch_perplexity_summary(company_name: str, perplexity_key: str) -> str:
     }
 
     try:
-        response = requests.post("https://api.perplexity.ai/chat/completions", headers=headers, json=data)
-        return response.json()["choices"][0]["message"]["content"]
+        return _perplexity_chat(data, headers, stage="perplexity_company")
     except Exception as e:
         return f"[Error fetching summary for {company_name}: {e}]"
 
 
-def generate_competitor_positioning_insight(top_df: pd.DataFrame,
-                                            client_info: dict,
-                                            perplexity_key: str) -> str:
-    """
-    Generate a strategic insight on how the client can position themselves
-    against the top federal awardees based on live Perplexity web results.
-    """
-    # Pull top 10 company names
-    top_companies = top_df["recipient_name"].head(10).tolist()
-    company_profiles = {}
+def _is_fetch_error(text: str) -> bool:
+    return text.startswith("[Error")
 
-    for name in top_companies:
-        summary = fetch_perplexity_summary(name, perplexity_key)
-        company_profiles[name] = summary
 
-    # Construct prompt
-    prompt = f"""
-You are a senior strategic advisor for a government contractor.
+def _profile_key(name: str, uei: str | None) -> str:
+    """Recipients are keyed by UEI when known, else by normalised name."""
+    if uei and str(uei).strip() and str(uei).lower() != "nan":
+        return f"uei:{str(uei).strip().upper()}"
+    return "name:" + re.sub(r"\s+", " ", name).strip().lower()
 
-Your client is:
-{json.dumps(client_info, indent=2)}
 
-The following companies are the top 10 recipients of federal awards in this NAICS code:
-{top_companies}
+def get_competitor_profiles(recipients: list[tuple[str, str | None]],
+                            perplexity_key: str) -> dict[str, str]:
+    """
+    Perplexity profiles for [(recipient_name, uei), ...], returned as
+    {recipient_name: summary}.  Profiles are cached per recipient for
+    config.COMPETITOR_PROFILE_TTL_DAYS; only missing or stale ones are fetched,
+    concurrently.  Failed fetches are returned but not cached.
+    """
+    max_age = config.COMPETITOR_PROFILE_TTL_DAYS * 86400
+    profiles, missing = {}, []
+    for name, uei in recipients:
+        cached = cache_get("competitor_profile", _profile_key(name, uei), max_age=max_age)
+        if cached is not None:
+            profiles[name] = cached
+        else:
+            missing.append((name, uei))
+
+    if missing:
+        fetch = telemetry.bind(lambda name: fetch_perplexity_summary(name, perplexity_key))
+        with ThreadPoolExecutor(max_workers=config.PERPLEXITY_MAX_WORKERS) as pool:
+            summaries = list(pool.map(fetch, [name for name, _ in missing]))
+        for (name, uei), summary in zip(missing, summaries):
+            profiles[name] = summary
+            if not _is_fetch_error(summary):
+                cache_put("competitor_profile", _profile_key(name, uei), summary)
+
+    return {name: profiles[name] for name, _ in recipients}
 
-Below are Perplexity-based summaries of these companies and their competitive positioning:
 
-{json.dumps(company_profiles, indent=2)}
+def generate_competitor_positioning_insight(top_df: pd.DataFrame,
+                                            client_info: dict,
+                                            perplexity_key: str,
+                                            run_id: str | None = None) -> str:
+    """
+    Generate a strategic insight on how the client can position themselves
+    against the top federal awardees based on Perplexity web results.
 
-Based on this information:
-- Recommend whether the client should target or avoid competing with any of these companies.
-- Explain which competitors represent threats vs. opportunities.
-- Suggest a clear positioning strategy for the client that exploits unique advantages or avoids vulnerable areas.
+    Competitor profiles come from get_competitor_profiles (cached per
+    recipient); with a `run_id` the finished insight is cached per
+    (USAspending run, company profile), so re-renders cost no API calls.
+    """
+    model = model_for("competitor")
+    insight_key = None
+    if run_id:
+        insight_key = stable_hash(run_id, client_info, model, _COMPETITOR_INSTRUCTIONS)
+        cached = cache_get("competitor_insight", insight_key)
+        if cached is not None:
+            return cached
 
-Be candid, strategic, and insightful. Avoid generic statements. Focus on specifics where possible.
-"""
+    # Pull top 10 company names
+    top10 = top_df.head(10)
+    top_companies = top10["recipient_name"].tolist()
+    ueis = top10["recipient_uei"].tolist() if "recipient_uei" in top10 else [None] * len(top_companies)
+    company_profiles = get_competitor_profiles(list(zip(top_companies, ueis)), perplexity_key)
+
+    variable = (
+        f"Top 10 recipients of federal awards in this NAICS code:\n{top_companies}\n\n"
+        f"Perplexity-based summaries of these companies and their competitive positioning:\n"
+        f"{json.dumps(company_profiles, indent=2)}"
+    )
 
     try:
         content_out = _chat_complete(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a strategic advisor for government contractors."},
-                {"role": "user", "content": prompt}
-            ],
+            model=model,
+            messages=_prefixed_messages(client_info, _COMPETITOR_INSTRUCTIONS, variable),
             temperature=0.5,
-            max_tokens=700
+            max_tokens=700,
+            stage="competitor",
         )
-        return content_out.strip()
     except Exception as e:
         return f"[GPT Insight Generation Error: {e}]"
 
+    insight = content_out.strip()
+    # an insight built on failed profile fetches isn't worth keeping
+    if insight_key and not any(_is_fetch_error(p) for p in company_profiles.values()):
+        cache_put("competitor_insight", insight_key, insight)
+    return insight
+
 
 def fetch_perplexity_year_insight(year: int, naics_code: str, perplexity_key: str) -> str:
     """
@@ -409,12 +848,43 @@ def fetch_perplexity_year_insight(year: int, naics_code: str, perplexity_key: st
     }
 
     try:
-        response = requests.post("https://api.perplexity.ai/chat/completions", headers=headers, json=data)
-        return response.json()["choices"][0]["message"]["content"]
+        return _perplexity_chat(data, headers, stage="perplexity_year")
     except Exception as e:
         return f"[Error fetching Perplexity summary for {year}: {e}]"
 
 
+def get_year_insights(years: list[int], naics_code: str, perplexity_key: str) -> dict[str, str]:
+    """
+    Perplexity year summaries for one NAICS code as {"2023": summary, ...}.
+
+    Summaries are cached per (year, NAICS): past years never expire, the
+    current (still open) year is refreshed after
+    config.YEAR_INSIGHT_CURRENT_TTL_HOURS.  Missing years are fetched
+    concurrently; failed fetches are returned but not cached.
+    """
+    current_year = datetime.date.today().year
+    insights, missing = {}, []
+    for year in years:
+        year = int(year)
+        max_age = config.YEAR_INSIGHT_CURRENT_TTL_HOURS * 3600 if year >= current_year else None
+        cached = cache_get("year_insight", f"{naics_code}:{year}", max_age=max_age)
+        if cached is not None:
+            insights[str(year)] = cached
+        else:
+            missing.append(year)
+
+    if missing:
+        fetch = telemetry.bind(lambda year: fetch_perplexity_year_insight(year, naics_code, perplexity_key))
+        with ThreadPoolExecutor(max_workers=config.PERPLEXITY_MAX_WORKERS) as pool:
+            summaries = list(pool.map(fetch, missing))
+        for year, summary in zip(missing, summaries):
+            insights[str(year)] = summary
+            if not _is_fetch_error(summary):
+                cache_put("year_insight", f"{naics_code}:{year}", summary)
+
+    return {str(int(y)): insights[str(int(y))] for y in years}
+
+
 def generate_trend_insight_by_year(yearly_df: pd.DataFrame,
                                    chart_title: str,
                                    client_info: dict,
@@ -422,49 +892,42 @@ def generate_trend_insight_by_year(yearly_df: pd.DataFrame,
                                    perplexity_key: str) -> str:
     """
     Generates insight narrative with NAICS-specific context for year-by-year trends.
+
+    Year summaries come from get_year_insights; the narrative itself is cached
+    on its exact inputs, so it is only regenerated when the totals, the
+    company profile or a (current-year) summary change.
     """
     recent_years = yearly_df["year"].astype(int).dropna().sort_values(ascending=False).unique()[:5]
-    perplexity_insights = {}
-
-    for year in recent_years:
-        summary = fetch_perplexity_year_insight(year, naics_code, perplexity_key)
-        perplexity_insights[str(year)] = summary
-
-    prompt = f"""
-You are a federal market strategist helping a client analyze multi-year federal spending trends.
-
-Client Info:
-{json.dumps(client_info, indent=2)}
-
-NAICS Code: {naics_code}
-
-Chart Context: {chart_title}
-
-Recent Yearly Award Totals:
-{yearly_df[yearly_df['year'].isin(recent_years)][['year', 'total_awarded']].to_string(index=False)}
-
-Perplexity-based web context for NAICS {naics_code}:
-{json.dumps(perplexity_insights, indent=2)}
-
-Generate a detailed and strategic insight that includes:
-- Real explanations for peaks or declines in award values
-- Specific agency or program shifts if relevant
-- Opportunities and risks based on recent policy or market moves
-- Recommendations for the client's positioning
+    perplexity_insights = get_year_insights(list(recent_years), naics_code, perplexity_key)
+
+    variable = (
+        f"NAICS Code: {naics_code}\n\n"
+        f"Chart Context: {chart_title}\n\n"
+        f"Recent Yearly Award Totals:\n"
+        f"{yearly_df[yearly_df['year'].isin(recent_years)][['year', 'total_awarded']].to_string(index=False)}\n\n"
+        f"Perplexity-based web context for NAICS {naics_code}:\n"
+        f"{json.dumps(perplexity_insights, indent=2)}"
+    )
 
-Be specific. Avoid generic boilerplate.
-"""
+    model = model_for("trend")
+    messages = _prefixed_messages(client_info, _TREND_INSTRUCTIONS, variable)
+    insight_key = stable_hash(model, messages)
+    cached = cache_get("trend_insight", insight_key)
+    if cached is not None:
+        return cached
 
     try:
         content_out = _chat_complete(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a federal contracting strategy advisor."},
-                {"role": "user", "content": prompt}
-            ],
+            model=model,
+            messages=messages,
             temperature=0.5,
-            max_tokens=750
+            max_tokens=750,
+            stage="trend",
         )
-        return content_out.strip()
     except Exception as e:
         return f"[GPT Insight Generation Error: {e}]"
+
+    insight = content_out.strip()
+    if not any(_is_fetch_error(p) for p in perplexity_insights.values()):
+        cache_put("trend_insight", insight_key, insight)
+    return insight
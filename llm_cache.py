@@ -0,0 +1,117 @@
+# llm_cache.py
+"""
+Small persistent key/value cache for LLM and web-API results.
+
+Values are stored as JSON in one SQLite table, partitioned by a namespace
+("chunk_summary", ...).  `max_age` (seconds) on reads lets callers apply a TTL
+without the cache having to know about it.
+
+Embedding vectors live in a second table as float32 BLOBs keyed by
+sha256(model + text), see `embeddings_get` / `embeddings_put`.
+"""
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+import config
+
+_local = threading.local()
+
+
+def stable_hash(*parts) -> str:
+    """sha256 over a canonical JSON dump of `parts` (dicts are key-sorted)."""
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _conn() -> sqlite3.Connection:
+    # one connection per thread; sqlite3 connections aren't shareable
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(config.CACHE_DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                namespace  TEXT NOT NULL,
+                key        TEXT NOT NULL,
+                value      TEXT,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key        TEXT PRIMARY KEY,
+                model      TEXT NOT NULL,
+                dim        INTEGER NOT NULL,
+                vec        BLOB NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def cache_get(namespace: str, key: str, max_age: float | None = None):
+    """Return the cached value, or None if missing or older than `max_age`."""
+    row = _conn().execute(
+        "SELECT value, created_at FROM llm_cache WHERE namespace = ? AND key = ?",
+        (namespace, key),
+    ).fetchone()
+    if row is None:
+        return None
+    if max_age is not None and time.time() - row[1] > max_age:
+        return None
+    return json.loads(row[0])
+
+
+def cache_put(namespace: str, key: str, value) -> None:
+    conn = _conn()
+    conn.execute(
+        "INSERT OR REPLACE INTO llm_cache (namespace, key, value, created_at) VALUES (?, ?, ?, ?)",
+        (namespace, key, json.dumps(value, ensure_ascii=False), time.time()),
+    )
+    conn.commit()
+
+
+# ----------------------------------------------------------------------------
+# Embeddings
+# ----------------------------------------------------------------------------
+_SQL_VARS = 500     # stay well under SQLite's bound-parameter limit
+
+
+def embedding_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def embeddings_get(model: str, texts: list[str]) -> dict[str, array]:
+    """Cached vectors for whichever of `texts` are stored, as {text: float32 array}."""
+    by_key = {embedding_key(model, t): t for t in texts}
+    keys = list(by_key)
+    out = {}
+    conn = _conn()
+    for i in range(0, len(keys), _SQL_VARS):
+        part = keys[i:i + _SQL_VARS]
+        rows = conn.execute(
+            f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+        )
+        for key, blob in rows:
+            out[by_key[key]] = array("f", blob)
+    return out
+
+
+def embeddings_put(model: str, vectors: dict[str, list[float]]) -> None:
+    if not vectors:
+        return
+    now = time.time()
+    conn = _conn()
+    conn.executemany(
+        "INSERT OR REPLACE INTO embeddings (key, model, dim, vec, created_at) VALUES (?, ?, ?, ?, ?)",
+        [(embedding_key(model, t), model, len(v), array("f", v).tobytes(), now)
+         for t, v in vectors.items()],
+    )
+    conn.commit()
@@ -0,0 +1,242 @@
+# llm_scheduler.py
+"""
+Central scheduler in front of every OpenAI chat / embedding call.
+
+Each model gets its own scheduler that
+  * estimates the tokens a request will consume (prompt + max_tokens),
+  * keeps a sliding one-minute window of requests and tokens so calls are
+    held back *before* they would exceed the configured RPM / TPM budget,
+  * retries 429s and transient server/connection errors, honouring the
+    server's retry-after hint (or jittered exponential backoff) and pausing
+    every caller of that model while the hint is in effect,
+  * adapts its concurrency limit to the observed 429 rate: halve on a 429,
+    grow by one after a full window of clean calls (AIMD).
+
+Oversized prompts ("Request too large", context-length errors) and exhausted
+quota are *not* retried here — they bubble up so the caller's truncation logic
+in gpt_analysis can shrink the prompt.
+"""
+import re
+import time
+import random
+import threading
+from collections import deque
+
+import config
+
+try:
+    import tiktoken
+    _ENC = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENC = None
+
+_TRANSIENT_ERRORS = {
+    "RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError",
+    "ServiceUnavailableError", "Timeout", "TryAgain", "APIError",
+}
+_WINDOW_SECONDS = 60.0
+
+
+# ----------------------------------------------------------------------------
+# Token estimation
+# ----------------------------------------------------------------------------
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENC is not None:
+        return len(_ENC.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` to at most `max_tokens` tokens (character estimate without tiktoken)."""
+    if _ENC is None:
+        return text[: max_tokens * 4]
+    tokens = _ENC.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else _ENC.decode(tokens[:max_tokens])
+
+
+def estimate_chat_tokens(messages: list, max_tokens: int) -> int:
+    """Prompt tokens plus the completion allowance (both count against TPM)."""
+    prompt = sum(count_tokens(str(m.get("content", ""))) + 4 for m in messages)
+    return prompt + (max_tokens or 0)
+
+
+def estimate_embedding_tokens(inputs) -> int:
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    return sum(count_tokens(t) for t in inputs)
+
+
+# ----------------------------------------------------------------------------
+# Error classification
+# ----------------------------------------------------------------------------
+def _is_rate_limit(e: Exception) -> bool:
+    return type(e).__name__ == "RateLimitError" or getattr(e, "status_code", None) == 429
+
+
+def _is_retryable(e: Exception) -> bool:
+    err = str(e).lower()
+    if "request too large" in err or "maximum context length" in err:
+        return False          # caller must shrink the prompt
+    if "insufficient_quota" in err:
+        return False          # waiting won't help
+    status = getattr(e, "status_code", None)
+    return type(e).__name__ in _TRANSIENT_ERRORS or status == 429 or (status or 0) >= 500
+
+
+def _parse_duration(value: str) -> float | None:
+    """Parse '1.5', '20ms', '1s', '6m0s' style hints into seconds."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total, matched = 0.0, False
+    for num, unit in re.findall(r"([\d.]+)\s*(ms|s|m|h)", value):
+        matched = True
+        total += float(num) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total if matched else None
+
+
+def retry_after_seconds(e: Exception) -> float | None:
+    """Best-effort read of the server's retry hint from headers or message."""
+    resp = getattr(e, "response", None)
+    headers = getattr(resp, "headers", None) or getattr(e, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000.0
+        for key in ("retry-after", "x-ratelimit-reset-tokens", "x-ratelimit-reset-requests"):
+            secs = _parse_duration(headers.get(key, ""))
+            if secs is not None:
+                return secs
+    except Exception:
+        pass
+    m = re.search(r"try again in ([\d.]+\s*(?:ms|s|m))", str(e), flags=re.I)
+    return _parse_duration(m.group(1)) if m else None
+
+
+# ----------------------------------------------------------------------------
+# Scheduler
+# ----------------------------------------------------------------------------
+class LLMScheduler:
+    def __init__(self,
+                 rpm: int,
+                 tpm: int,
+                 max_concurrency: int,
+                 min_concurrency: int = 1,
+                 max_retries: int = 8,
+                 base_backoff: float = 1.0,
+                 max_backoff: float = 60.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._cond = threading.Condition()
+        self._window: deque[tuple[float, int]] = deque()   # (started_at, tokens)
+        self._window_tokens = 0
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._clean_streak = 0
+        self.stats = {"calls": 0, "rate_limited": 0, "retries": 0}
+
+    # -- budget bookkeeping -------------------------------------------------
+    def _prune(self, now: float) -> None:
+        while self._window and now - self._window[0][0] >= _WINDOW_SECONDS:
+            _, tok = self._window.popleft()
+            self._window_tokens -= tok
+
+    def _acquire(self, tokens: int) -> None:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                fits_tpm = (self._window_tokens + tokens <= self.tpm) or not self._window
+                if (now >= self._paused_until
+                        and self._in_flight < self.concurrency
+                        and len(self._window) < self.rpm
+                        and fits_tpm):
+                    self._window.append((now, tokens))
+                    self._window_tokens += tokens
+                    self._in_flight += 1
+                    return
+
+                waits = [0.05]
+                if now < self._paused_until:
+                    waits.append(self._paused_until - now)
+                if self._window and (len(self._window) >= self.rpm or not fits_tpm):
+                    waits.append(_WINDOW_SECONDS - (now - self._window[0][0]))
+                self._cond.wait(timeout=max(waits))
+
+    def _release(self, rate_limited: bool = False, pause: float = 0.0) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if rate_limited:
+                self.stats["rate_limited"] += 1
+                self._clean_streak = 0
+                self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            else:
+                self._clean_streak += 1
+                if self._clean_streak >= self.concurrency and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self._clean_streak = 0
+            self._cond.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        delay = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+        return random.uniform(delay / 2, delay)       # jitter
+
+    # -- public entry point -------------------------------------------------
+    def run(self, fn, tokens: int, on_retry=None):
+        """
+        Call `fn()` once budget allows, retrying rate limits and transient
+        errors.  `on_retry(attempt, error, delay)` is invoked before each wait.
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire(tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                if not _is_retryable(e) or attempt == self.max_retries:
+                    self._release()
+                    raise
+                hint = retry_after_seconds(e)
+                delay = (hint + random.uniform(0, 0.5)) if hint else self._backoff(attempt)
+                self._release(rate_limited=_is_rate_limit(e), pause=delay)
+                self.stats["retries"] += 1
+                if on_retry:
+                    on_retry(attempt + 1, e, delay)
+                print(f"⏳ {type(e).__name__}; retry {attempt + 1}/{self.max_retries} in {delay:.1f}s "
+                      f"(concurrency now {self.concurrency})")
+                time.sleep(delay)
+                continue
+            self.stats["calls"] += 1
+            self._release()
+            return result
+
+
+_SCHEDULERS: dict[str, LLMScheduler] = {}
+_SCHEDULERS_LOCK = threading.Lock()
+
+
+def get_scheduler(model: str) -> LLMScheduler:
+    """One scheduler per model, since OpenAI budgets are per model."""
+    with _SCHEDULERS_LOCK:
+        if model not in _SCHEDULERS:
+            limits = {**config.LLM_RATE_LIMITS.get("default", {}),
+                      **config.LLM_RATE_LIMITS.get(model, {})}
+            _SCHEDULERS[model] = LLMScheduler(
+                rpm=limits["rpm"],
+                tpm=limits["tpm"],
+                max_concurrency=limits.get("max_concurrency", config.LLM_MAX_CONCURRENCY),
+                max_retries=config.LLM_MAX_RETRIES,
+            )
+        return _SCHEDULERS[model]
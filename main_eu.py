@@ -1,24 +1,39 @@
 # eu_main.py
 import json, time, pandas as pd, config
 from eu_api_fetcher import fetch_all_pages
-from rss_parser     import load_articles_from_db
 from file_utils     import download_attachment, truncate_to_token_limit
 from gpt_analysis   import (
     generate_insights, generate_swot_analysis,
-    generate_solicitation_tags, generate_news_impact_paragraph,
+    generate_solicitation_tags, generate_news_impacts,
+    generate_structured_analysis, structured_to_row_fields,
 )
-from news_relevance import article_is_relevant
+from notice_matches import register_notice, record_matches
+from relevance_engine import RelevanceEngine
 from file_utils import filter_attachments
+from batch_runner import run_batch_pipeline, default_run_name
+import telemetry
+from telemetry import print_stage_summary
 
-def run_eu_pipeline(keywords=None, out_json="eu_results.json"):
+def run_eu_pipeline(keywords=None, out_json="eu_results.json",
+                    batch=False, batch_endpoint=None, batch_run_name=None, debug=False):
+    """
+    Pull EU tenders and analyse every open one that has attachments.
+    With ``batch=True`` the GPT chain is deferred to the offline batch runner
+    (see batch_runner.py) and the rows are filled in once it finishes.
+    News relevance is scored for all analysed tenders in one pass after the
+    loop; ``debug=True`` prints every (tender, article) pair's scores.
+    """
     t0 = time.time()
-    articles = load_articles_from_db()
+    if not batch:
+        telemetry.start_run("eu")      # the batch runner starts its own run
     pages    = fetch_all_pages()
     if not pages:
         print("❌ EU API returned nothing.")
         return []
 
     rows, seen = [], set()
+    jobs, job_rows = {}, {}
+    pending = {}      # reference -> (row, tags, sol_text) awaiting news impacts
 
     for pg in pages:
         for item in pg.get("results", []):
@@ -29,6 +44,7 @@ def run_eu_pipeline(keywords=None, out_json="eu_results.json"):
             if url in seen:
                 continue
             seen.add(url)
+            telemetry.set_notice(item.get("reference"))
 
             # --------------- metadata -----------------------
             meta        = item.get("metadata", {})
@@ -65,28 +81,38 @@ def run_eu_pipeline(keywords=None, out_json="eu_results.json"):
             insights = swot = ""
             tags     = []
             impacts  = []
+            fields   = {}
+            news     = None
 
-            if downloads:
+            if downloads and batch:
                 content  = item["content"]
                 desc     = meta.get("description", "")
                 desc_b   = meta.get("descriptionByte", "")
+                jobs[item["reference"]] = {
+                    "content": content,
+                    "description": desc,
+                    "description_byte": desc_b,
+                    "attachments": downloads,
+                    "sol_text": f"{content} {desc} {desc_b}",
+                    "title": meta.get("title", ""),
+                }
 
-                insights = generate_insights(content, desc, desc_b, downloads)
-                swot     = generate_swot_analysis(content, desc, desc_b, insights, config.company_info)
-                tags     = generate_solicitation_tags(content, desc, insights)
-
-                sol_text = f"{content} {desc} {desc_b}"
-                for art in articles:
-                    art_txt = f"{art['title']} {art['description']} {art['content_encoded']}"
-                    art_title = f"{art['title']}"
-                    if article_is_relevant(art_title, art_txt, tags, sol_text):
-                        impacts.append({
-                            "article_title": art["title"],
-                            "article_link": art["link"],
-                            "impact": generate_news_impact_paragraph(
-                                insights, art, config.company_info
-                            )
-                        })
+            elif downloads:
+                content  = item["content"]
+                desc     = meta.get("description", "")
+                desc_b   = meta.get("descriptionByte", "")
+
+                if config.GPT_SINGLE_PASS_ANALYSIS:
+                    fields   = structured_to_row_fields(generate_structured_analysis(
+                        content, desc, desc_b, downloads, config.company_info))
+                    insights, swot, tags = fields["insights"], fields["swot"], fields["tags"]
+                else:
+                    insights = generate_insights(content, desc, desc_b, downloads)
+                    swot     = generate_swot_analysis(content, desc, desc_b, insights, config.company_info)
+                    tags     = generate_solicitation_tags(content, desc, insights)
+
+                if isinstance(tags, list):
+                    news = (tags, f"{content} {desc} {desc_b}")
 
             # --------------- collect row --------------------
             rows.append({
@@ -99,17 +125,71 @@ def run_eu_pipeline(keywords=None, out_json="eu_results.json"):
                 "swot"         : swot,
                 "tags"         : "; ".join(tags),
                 "news_impacts" : impacts,
+                "value"            : fields.get("value"),
+                "value_confidence" : fields.get("value_confidence"),
             })
+            if item["reference"] in jobs:
+                job_rows[item["reference"]] = rows[-1]
+            if news:
+                pending[item["reference"]] = (rows[-1], *news)
             print(f"EU – processed {len(rows)} rows…")
 
+    # --------------- news relevance (one pass) + impacts ------
+    # a failure here leaves the rows without news impacts; they are still written below
+    matches = []
+    if pending:
+        try:
+            engine, candidates = RelevanceEngine.for_notices(
+                [(tags, row["title"]) for row, tags, _ in pending.values()]
+            )
+            matches = engine.relevant_many(
+                [(tags, sol_text) for _, tags, sol_text in pending.values()],
+                debug=debug, candidates=candidates,
+            )
+        except Exception as e:
+            print(f"❌ News relevance failed: {e}")
+    for (ref, (row, tags, sol_text)), scored in zip(pending.items(), matches):
+        telemetry.set_notice(ref)
+        try:
+            impacts = generate_news_impacts(row["insights"], scored, config.company_info)
+            register_notice(ref, tags, sol_text, row["insights"], row["title"])
+            record_matches(ref, scored, impacts)
+        except Exception as e:
+            print(f"❌ News impacts failed for {ref}: {e}")
+            continue
+        row["news_impacts"] = impacts
+
+    # --------------- batch mode: fill deferred rows ------------
+    if batch:
+        # nothing new to analyse (every notice cached): no batch run at all
+        results = run_batch_pipeline(
+            jobs,
+            run_name=batch_run_name or default_run_name("eu", jobs),
+            endpoint=batch_endpoint,
+        ) if jobs else {}
+        for ref, res in results.items():
+            if ref not in job_rows:
+                continue
+            tags = res["tags"]
+            job_rows[ref].update({
+                "insights"     : res["insights"],
+                "swot"         : res["swot"],
+                "tags"         : "; ".join(tags) if isinstance(tags, list) else tags,
+                "news_impacts" : res["news_impacts"],
+                "value"            : res.get("value"),
+                "value_confidence" : res.get("value_confidence"),
+            })
+
     # --------------- write output -------------------------
     with open(out_json, "w", encoding="utf-8") as f:
         json.dump(rows, f, indent=2, ensure_ascii=False)
 
     print(f"✅ EU pipeline finished ➜ {out_json}  "
           f"[{len(rows)} rows, {time.time()-t0:.1f}s]")
+    print_stage_summary()
     return rows
 
 # -----------------------------------------------------------------
 if __name__ == "__main__":
-    run_eu_pipeline()
+    import sys
+    run_eu_pipeline(batch="--batch" in sys.argv, debug="--debug" in sys.argv)
@@ -4,16 +4,46 @@ import json
 import time
 import config                                        # your existing config.py :contentReference[oaicite:0]{index=0}&#8203;:contentReference[oaicite:1]{index=1}
 from sam_api_fetcher import fetch_sam_notices        # sam_api_fetcher.py
-from rss_parser import load_articles_from_db         # rss_parser.py :contentReference[oaicite:2]{index=2}&#8203;:contentReference[oaicite:3]{index=3}
 from gpt_analysis import (
     generate_insights,
     generate_swot_analysis,
     generate_solicitation_tags,
-    generate_news_impact_paragraph
+    generate_news_impact_paragraph,
+    generate_news_impacts,
+    generate_structured_analysis,
+    structured_to_row_fields,
 )                                                    # gpt_analysis.py :contentReference[oaicite:4]{index=4}&#8203;:contentReference[oaicite:5]{index=5}
-from news_relevance import article_is_relevant       # news_relevance.py :contentReference[oaicite:6]{index=6}&#8203;:contentReference[oaicite:7]{index=7}
+from notice_matches import register_notice, record_matches, stored_impacts, touch_notices, usable_impact
+from relevance_engine import RelevanceEngine       # news_relevance.py :contentReference[oaicite:6]{index=6}&#8203;:contentReference[oaicite:7]{index=7}
 from file_utils import filter_attachments
 from sam_api_fetcher import _build_query_and_mode
+from batch_runner import run_batch_pipeline, default_run_name
+import telemetry
+from telemetry import print_stage_summary
+
+
+def _build_row(notice_id: str, notice: dict, insights, swot, tag_text, impacts,
+               value=None, value_confidence=None) -> dict:
+    return {
+        "source":       "SAM.gov",
+        "sam_id":       notice_id,
+        "solicitation": notice.get("solicitation"),
+        "link":         notice.get("link"),
+        "naics":        notice.get("naics"),
+        "status":       notice.get("status"),
+        "title":        notice.get("title"),
+        "insights":     insights,
+        "swot":         swot,
+        "tags":         tag_text,
+        "news_impacts": impacts,
+        "value":            value,
+        "value_confidence": value_confidence,
+    }
+
+
+def _attachments_text(notice: dict, attachments: list[str]) -> str:
+    """The notice's attachment text, used for news relevance (not sent raw to GPT)."""
+    return notice.get("attachments_text", "") if attachments else ""
 
 
 def run_sam_pipeline(
@@ -21,16 +51,30 @@ def run_sam_pipeline(
     out_json: str = "sam_results.json",
     notice_cache_file: str = "guam_notice_cache.json",
     processed_cache_file: str = "processed_sam_cache.json",
+    batch: bool = False,
+    batch_endpoint: str | None = None,
+    batch_run_name: str | None = None,
+    debug: bool = False,
 ) -> list[dict]:
     """
     Pull SAM.gov notices, analyse them, and write results to disk **incrementally** so
     the script can be interrupted and safely restarted without repeating work.
     All GPT calls are wrapped in a MAX_GPT_RETRIES guard to stop infinite loops.
+
+    With ``batch=True`` the uncached notices are analysed through the offline
+    batch runner instead (see batch_runner.py); re-running with the same
+    ``batch_run_name`` resumes an interrupted batch run.
+
+    News relevance is scored for all analysed notices in one pass (step 4)
+    before any impact is generated; ``debug=True`` prints every
+    (notice, article) pair's scores.
     """
     import os, json, time, traceback
 
     MAX_GPT_RETRIES = 1      # per notice for insights / swot / tags
     t0 = time.time()
+    if not batch:
+        telemetry.start_run("sam")     # the batch runner starts its own run
 
     # ------------------------------------------------------------------ 1. Load notices
     if os.path.exists(notice_cache_file):
@@ -60,18 +104,83 @@ def run_sam_pipeline(
             json.dump(processed_cache, f_cache, indent=2, ensure_ascii=False)
 
     rows: list[dict] = []
-    articles = load_articles_from_db()
 
-    # ------------------------------------------------------------------ 3. Main loop
+    if batch:
+        jobs = {}
+        for n_idx, notice in enumerate(notices, 1):
+            notice_id = notice.get("sam_id") or f"idx_{n_idx}"
+            if notice_id in processed_cache:
+                continue
+            desc = notice.get("description", "")
+            attachments = filter_attachments(notice.get("attachments", []))
+            jobs[notice_id] = {
+                "content": desc,      # attachments go in as extracted text, see _insights_lines
+                "description": desc,
+                "description_byte": "",
+                "attachments": attachments,
+                "sol_text": f"{_attachments_text(notice, attachments) or desc} {desc}",
+                "title": notice.get("title") or "",
+            }
+
+        # nothing new to analyse (every notice cached): no batch run at all
+        results = run_batch_pipeline(
+            jobs,
+            run_name=batch_run_name or default_run_name("sam", jobs),
+            endpoint=batch_endpoint,
+        ) if jobs else {}
+        for n_idx, notice in enumerate(notices, 1):
+            notice_id = notice.get("sam_id") or f"idx_{n_idx}"
+            if notice_id in results:
+                res = results[notice_id]
+                tags = res["tags"]
+                processed_cache[notice_id] = _build_row(
+                    notice_id, notice, res["insights"], res["swot"],
+                    "; ".join(tags) if isinstance(tags, list) else tags,
+                    res["news_impacts"],
+                    res.get("value"), res.get("value_confidence"),
+                )
+            if notice_id in processed_cache:
+                rows.append(processed_cache[notice_id])
+        _flush_cache()
+
+        with open(out_json, "w", encoding="utf-8") as f_out:
+            json.dump(rows, f_out, indent=2, ensure_ascii=False)
+        print(f"🏁 SAM batch pipeline done → {out_json}  ({len(rows)} rows, {time.time() - t0:.1f}s)")
+        return rows
+
+    seen_cached: list[str] = []
+    # analysed notices still waiting for their news impacts: {notice_id: (row, tags, sol_text)}
+    pending: dict[str, tuple[dict, list[str], str]] = {}
+
+    ######################################################## GPT‑calls with retry
+    def _safe_call(fn, *a, **kw):
+        for i in range(1, MAX_GPT_RETRIES + 1):
+            try:
+                return fn(*a, **kw)
+            except Exception as e:
+                print(f"⚠️ {i}/{MAX_GPT_RETRIES} {fn.__name__} failed: {e}")
+                if i == MAX_GPT_RETRIES:
+                    return f"[ERROR after {MAX_GPT_RETRIES} tries]"
+                time.sleep(2)
+
+    # ------------------------------------------------------------------ 3. Main loop (analysis)
     for n_idx, notice in enumerate(notices, 1):
         notice_id = notice.get("sam_id") or f"idx_{n_idx}"
         if notice_id in processed_cache:
-            rows.append(processed_cache[notice_id])
+            row = processed_cache[notice_id]
+            if "news_pending" in row:     # interrupted before its news impacts
+                pending[notice_id] = (row, row["news_pending"]["tags"], row["news_pending"]["sol_text"])
+            elif "news_impacts" in row:
+                # picks up matches found since by rss_pull's incremental matching
+                row["news_impacts"] = stored_impacts(notice_id) or row["news_impacts"]
+            rows.append(row)
+            seen_cached.append(notice_id)
             print(f"🔄  Skipping (cached) {notice_id}")
             continue
         
         
         print(f"🚀 Processing {notice_id}  [{n_idx}/{len(notices)}]")
+        telemetry.set_notice(notice_id)
         try:
             ######################################################## attachments filter
             desc = notice.get("description", "")
@@ -81,71 +190,44 @@ def run_sam_pipeline(
             # Now we only keep the small or “RFP/SOW/…” attachments
             attachments = filter_attachments(raw_attachments)
 
-            ######################################################## GPT‑calls with retry
-            def _safe_call(fn, *a, **kw):
-                for i in range(1, MAX_GPT_RETRIES + 1):
-                    try:
-                        return fn(*a, **kw)
-                    except Exception as e:
-                        print(f"⚠️ {i}/{MAX_GPT_RETRIES} {fn.__name__} failed: {e}")
-                        if i == MAX_GPT_RETRIES:
-                            return f"[ERROR after {MAX_GPT_RETRIES} tries]"
-                        time.sleep(2)
-
-            content_for_gpt = desc if not attachments else (
-                notice.get("attachments_text", "") or desc
-            )
+            # the attachments reach GPT through extract_text_from_files (map-reduced when
+            # oversized), so the prompts' own content is the description only
+            content_for_gpt = desc
 
-            insights = _safe_call(
-                generate_insights,
-                content_for_gpt, desc, "", attachments,
-            )
-            swot = _safe_call(
-                generate_swot_analysis,
-                content_for_gpt, desc, "", insights, config.company_info,
-            )
-            tags = _safe_call(
-                generate_solicitation_tags,
-                content_for_gpt, desc, insights,
-            )
-
-            ######################################################## news impacts
-            impacts = []
-            if isinstance(tags, list):
-                tag_text = "; ".join(tags)
-                sol_text = f"{content_for_gpt} {desc}"
-                for art in articles:
-                    art_txt = f"{art['title']} {art['description']} {art.get('content_encoded','')}"
-                    if article_is_relevant(art["title"], art_txt, tags, sol_text):
-                        impacts.append({
-                            "article_title": art["title"],
-                            "article_link": art["link"],
-                            "impact": _safe_call(
-                                generate_news_impact_paragraph,
-                                insights, art, config.company_info
-                            ),
-                        })
+            fields = {}
+            if config.GPT_SINGLE_PASS_ANALYSIS:
+                fields = structured_to_row_fields(_safe_call(
+                    generate_structured_analysis,
+                    content_for_gpt, desc, "", attachments, config.company_info,
+                ))
+                insights, swot, tags = fields["insights"], fields["swot"], fields["tags"]
             else:
-                tag_text = tags  # already an error string
+                insights = _safe_call(
+                    generate_insights,
+                    content_for_gpt, desc, "", attachments,
+                )
+                swot = _safe_call(
+                    generate_swot_analysis,
+                    content_for_gpt, desc, "", insights, config.company_info,
+                )
+                tags = _safe_call(
+                    generate_solicitation_tags,
+                    content_for_gpt, desc, insights,
+                )
 
             ######################################################## assemble row
-            row = {
-                "source":       "SAM.gov",
-                "sam_id":       notice_id,
-                "solicitation": notice.get("solicitation"),
-                "link":         notice.get("link"),
-                "naics":        notice.get("naics"),
-                "status":       notice.get("status"),
-                "title":        notice.get("title"),
-                "insights":     insights,
-                "swot":         swot,
-                "tags":         tag_text,
-                "news_impacts": impacts,
-            }
+            tag_text = "; ".join(tags) if isinstance(tags, list) else tags
+            row = _build_row(notice_id, notice, insights, swot, tag_text, [],
+                             fields.get("value"), fields.get("value_confidence"))
+            if isinstance(tags, list):
+                # news impacts follow the relevance pass over all notices (step 4)
+                sol_text = f"{_attachments_text(notice, attachments) or desc} {desc}"
+                row["news_pending"] = {"tags": tags, "sol_text": sol_text}
+                pending[notice_id] = (row, tags, row["news_pending"]["sol_text"])
             rows.append(row)
             processed_cache[notice_id] = row
             _flush_cache()
-            print(f"✅ Finished {notice_id} (cache size {len(processed_cache)})")
+            print(f"✅ Analysed {notice_id} (cache size {len(processed_cache)})")
 
         except Exception as e:  # catch EVERYTHING so the loop continues
             traceback.print_exc()
@@ -154,12 +236,61 @@ def run_sam_pipeline(
             _flush_cache()
             continue
 
-    # ------------------------------------------------------------------ 4. final output
+    # ------------------------------------------------------------------ 4. News relevance, all notices at once
+    matches = []
+    if pending:
+        try:
+            # BM25 candidates per notice, with their vectors precomputed at RSS ingest
+            engine, candidates = RelevanceEngine.for_notices(
+                [(tags, row.get("title") or "") for row, tags, _ in pending.values()]
+            )
+            matches = engine.relevant_many(
+                [(tags, sol_text) for _, tags, sol_text in pending.values()],
+                debug=debug, candidates=candidates,
+            )
+        except Exception as e:
+            # rows keep news_pending and are still written; the next run retries them
+            traceback.print_exc()
+            print(f"❌ News relevance failed: {e}")
+
+    # ------------------------------------------------------------------ 5. News impacts
+    for (notice_id, (row, tags, sol_text)), scored in zip(pending.items(), matches):
+        telemetry.set_notice(notice_id)
+        insights = row["insights"]
+        try:
+            impacts = generate_news_impacts(
+                insights, scored, config.company_info,
+                generate=lambda n, art: _safe_call(
+                    generate_news_impact_paragraph,
+                    insights, art, config.company_info
+                ),
+            )
+            register_notice(notice_id, tags, sol_text, insights, row.get("title") or "")
+            record_matches(notice_id, scored, impacts)
+        except Exception as e:
+            # news_pending stays on the cached row, so the next run retries the impacts
+            traceback.print_exc()
+            print(f"❌ News impacts failed for {notice_id}: {e}")
+            continue
+        # failed paragraphs ("[ERROR ...]") are left out and keep the row pending
+        row["news_impacts"] = [imp for imp in impacts if usable_impact(imp["impact"])]
+        if len(row["news_impacts"]) < len(impacts):
+            print(f"⚠️ {notice_id}: {len(impacts) - len(row['news_impacts'])} news impact(s) failed; retried next run")
+        else:
+            del row["news_pending"]
+        processed_cache[notice_id] = row
+        _flush_cache()
+        print(f"✅ Finished {notice_id} ({len(row['news_impacts'])} news impacts)")
+
+    touch_notices(seen_cached)     # still listed → still open for incremental matching
+
+    # ------------------------------------------------------------------ 6. final output
     with open(out_json, "w", encoding="utf-8") as f_out:
         json.dump(rows, f_out, indent=2, ensure_ascii=False)
 
     elapsed = time.time() - t0
     print(f"🏁 SAM pipeline done → {out_json}  ({len(rows)} rows, {elapsed:.1f}s)")
+    print_stage_summary()
     return rows
 
 
@@ -167,4 +298,5 @@ def run_sam_pipeline(
 
 
 if __name__ == "__main__":
-    run_sam_pipeline()
+    import sys
+    run_sam_pipeline(batch="--batch" in sys.argv, debug="--debug" in sys.argv)
@@ -17,7 +17,9 @@ def normalize_eu_row(row):
         "tags":         row["tags"],
         "insights":     row["insights"],
         "swot":         row["swot"],
-        "news_impacts": row["news_impacts"]
+        "news_impacts": row["news_impacts"],
+        "value":            row.get("value"),
+        "value_confidence": row.get("value_confidence"),
     }
 
 def normalize_sam_row(row):
@@ -32,7 +34,9 @@ def normalize_sam_row(row):
         "tags":         row["tags"],
         "insights":     row["insights"],
         "swot":         row["swot"],
-        "news_impacts": row["news_impacts"]
+        "news_impacts": row["news_impacts"],
+        "value":            row.get("value"),
+        "value_confidence": row.get("value_confidence"),
     }
 
 def run_combined_pipeline(out_json="combined_results_fire1.json", out_csv="combined_results_fire1.csv"):
@@ -0,0 +1,71 @@
+# model_router.py
+"""
+Stage → model routing with escalation.
+
+config.MODEL_TIERS names the model behind each tier ("fast", "standard",
+"large") and config.STAGE_MODEL_CASCADE lists, per stage label, the tiers to
+try in order.  Low-stakes stages (tags, article domain/tags, news impacts)
+start on the fast tier; `run_cascade` moves to the next tier only when the
+output fails the stage's validator, so the larger model is paid for only on
+the notices that need it.
+
+With config.MODEL_CASCADE = False every stage runs on the last tier of its
+cascade only (no cheap first attempt).
+"""
+import config
+
+
+def models_for(stage: str) -> list[str]:
+    """Models to try for `stage`, cheapest first, with duplicates removed."""
+    tiers = config.STAGE_MODEL_CASCADE.get(stage) or config.STAGE_MODEL_CASCADE["default"]
+    if not config.MODEL_CASCADE:
+        tiers = tiers[-1:]
+    models = []
+    for tier in tiers:
+        model = config.MODEL_TIERS[tier]
+        if model not in models:
+            models.append(model)
+    return models
+
+
+def model_for(stage: str) -> str:
+    """First (cheapest) model for a stage that is not run through `run_cascade`."""
+    return models_for(stage)[0]
+
+
+def run_cascade(stage: str, call, validate=None):
+    """
+    Run `call(model)` on each model of the stage's cascade until the result
+    passes `validate(result)`.  A ValueError raised by `call` (e.g. an
+    unparsable reply) also counts as a validation failure.  The last model's
+    result is returned even if it fails validation, and its ValueError is
+    re-raised, so callers keep their existing error handling.
+    """
+    models = models_for(stage)
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        try:
+            result = call(model)
+        except ValueError as e:
+            if last:
+                raise
+            reason = f"unparsable output ({e})"
+        else:
+            if last or validate is None or validate(result):
+                return result
+            reason = "output failed validation"
+        print(f"↗️ {stage}: {model} {reason}; escalating to {models[i + 1]}")
+
+
+# ---------- validators shared by the cascaded stages ----------------------
+def plausible_tags(tags: list[str], min_n: int = 2, max_n: int = 8) -> bool:
+    """A short list of short labels, not a sentence split on commas."""
+    return (min_n <= len(tags) <= max_n
+            and all(len(t) <= 60 and len(t.split()) <= 6 for t in tags))
+
+
+def plausible_paragraph(text: str, min_words: int = 20) -> bool:
+    """Non-trivial prose that isn't a refusal."""
+    head = text.strip().lower()[:40]
+    refused = head.startswith(("i'm sorry", "i am sorry", "i cannot", "i can't", "sorry"))
+    return len(text.split()) >= min_words and not refused
@@ -1,7 +1,19 @@
 # news_relevance.py
 
-import math
+import json
+import threading
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
 import config
+import telemetry
+from llm_cache import embeddings_get, embeddings_put
+from llm_scheduler import (
+    get_scheduler, estimate_chat_tokens, estimate_embedding_tokens, count_tokens, truncate_tokens,
+)
+from model_router import run_cascade, plausible_tags
 
 # 1) scikit-learn for TF-IDF local pre-filter
 from sklearn.feature_extraction.text import TfidfVectorizer
@@ -11,7 +23,8 @@ from sklearn.metrics.pairwise import cosine_similarity
 try:
     # New SDK (v1.x)
     from openai import OpenAI, BadRequestError, RateLimitError
-    client = OpenAI(api_key=getattr(config, "OPENAI_API_KEY", None))
+    # retries are owned by llm_scheduler, not the SDK
+    client = OpenAI(api_key=getattr(config, "OPENAI_API_KEY", None), max_retries=0)
     _OPENAI_V1 = True
 except Exception:
     # Legacy SDK (v0.x)
@@ -22,61 +35,166 @@ except Exception:
     _OPENAI_V1 = False
 
 
-def _embed(text: str, model: str | None = None) -> list[float]:
-    """
-    Return a single embedding vector for the given text, across SDK versions.
-    """
-    model = (
+# --- Embedding cache ----------------------------------------------------------
+# In-process LRU in front of the persistent SQLite store in llm_cache, both
+# keyed by (model, exact text): the same tags and articles recur across notices
+# and runs, so most lookups never reach the API.
+_EMB_LRU: OrderedDict = OrderedDict()
+_EMB_LRU_LOCK = threading.Lock()
+
+
+def _lru_get(model: str, text: str):
+    with _EMB_LRU_LOCK:
+        vec = _EMB_LRU.get((model, text))
+        if vec is not None:
+            _EMB_LRU.move_to_end((model, text))
+        return vec
+
+
+def _lru_put(model: str, text: str, vec) -> None:
+    with _EMB_LRU_LOCK:
+        _EMB_LRU[(model, text)] = vec
+        _EMB_LRU.move_to_end((model, text))
+        while len(_EMB_LRU) > config.EMBED_LRU_SIZE:
+            _EMB_LRU.popitem(last=False)
+
+
+def _embedding_model(model: str | None) -> str:
+    return (
         model
         or getattr(config, "GPT_MODEL_EMBEDDING", None)
         or getattr(config, "GPT_EMBED_MODEL", "text-embedding-3-small")
     )
-    if _OPENAI_V1:
-        resp = client.embeddings.create(model=model, input=text)
-        return resp.data[0].embedding
-    else:
-        resp = openai.Embedding.create(model=model, input=text)
-        return resp["data"][0]["embedding"]
 
 
-def _chat_complete(model: str, messages: list, temperature: float, max_tokens: int) -> str:
+def _embed(text: str, model: str | None = None) -> array:
     """
-    Uniform chat completion wrapper for both SDKs.
+    Return a single embedding vector (float32 array) for the given text, across
+    SDK versions.  Served from the LRU / persistent cache when this text was
+    embedded before.
     """
-    if _OPENAI_V1:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-        return resp.choices[0].message.content
-    else:
-        resp = openai.ChatCompletion.create(
-            model=model,
-            messages=messages,
-            temperature=temperature,
-            max_tokens=max_tokens,
-        )
-        return resp["choices"][0]["message"]["content"]
+    return embed_many([text], model)[0]
+
 
+def embed_many(texts: list[str], model: str | None = None) -> list[array]:
+    """
+    Embed many texts with as few requests as possible.
 
-def compute_cosine_similarity(vec_a: list[float], vec_b: list[float]) -> float:
+    Texts are de-duplicated and looked up in the LRU, then the persistent
+    cache; the rest are sent in batches of at most config.EMBED_BATCH_MAX_ITEMS
+    inputs / config.EMBED_BATCH_MAX_TOKENS tokens.  Returns one vector per
+    input text, in order.
+    """
+    model = _embedding_model(model)
+    found: dict[str, array] = {}
+    todo = []
+    for text in dict.fromkeys(texts):
+        vec = _lru_get(model, text)
+        if vec is None:
+            todo.append(text)
+        else:
+            found[text] = vec
+
+    if todo:
+        stored = embeddings_get(model, todo)
+        missing = [t for t in todo if t not in stored]
+        for batch in _embedding_batches(missing):
+            vectors = _embed_remote(batch, model)
+            fresh = {t: array("f", v) for t, v in zip(batch, vectors)}
+            embeddings_put(model, fresh)
+            stored.update(fresh)
+        for text, vec in stored.items():
+            _lru_put(model, text, vec)
+        found.update(stored)
+
+    return [found[t] for t in texts]
+
+
+def _embedding_batches(texts: list[str]):
+    """Yield lists of texts that respect the per-request item and token limits."""
+    batch, batch_tokens = [], 0
+    for text in texts:
+        n = min(count_tokens(text), config.EMBED_MAX_INPUT_TOKENS) + 1
+        if batch and (len(batch) >= config.EMBED_BATCH_MAX_ITEMS
+                      or batch_tokens + n > config.EMBED_BATCH_MAX_TOKENS):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += n
+    if batch:
+        yield batch
+
+
+def _embed_remote(texts: list[str], model: str) -> list[list[float]]:
+    # over-long inputs are cut to the model's limit rather than failing the
+    # whole batch; empty strings are rejected by the API
+    inputs = [truncate_tokens(t, config.EMBED_MAX_INPUT_TOKENS) or " " for t in texts]
+
+    def _call():
+        if _OPENAI_V1:
+            resp = client.embeddings.create(model=model, input=inputs)
+            data = sorted(resp.data, key=lambda d: d.index)
+            vectors = [d.embedding for d in data]
+        else:
+            resp = openai.Embedding.create(model=model, input=inputs)
+            data = sorted(resp["data"], key=lambda d: d["index"])
+            vectors = [d["embedding"] for d in data]
+        rec.usage = telemetry.usage_from_response(resp)
+        return vectors
+
+    with telemetry.track_call("embedding", model) as rec:
+        return get_scheduler(model).run(_call, estimate_embedding_tokens(inputs),
+                                        on_retry=rec.on_retry)
+
+
+def article_text(art: dict) -> str:
+    """The text an RSS article is matched and embedded by."""
+    return f"{art['title']} {art['description']} {art.get('content_text') or ''}"
+
+
+def _chat_complete(model: str, messages: list, temperature: float, max_tokens: int,
+                   stage: str = "other") -> str:
+    """
+    Uniform chat completion wrapper for both SDKs, paced by llm_scheduler.
+    """
+    def _call():
+        if _OPENAI_V1:
+            resp = client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+            text = resp.choices[0].message.content
+        else:
+            resp = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+            text = resp["choices"][0]["message"]["content"]
+        rec.usage = telemetry.usage_from_response(resp)
+        return text
+
+    with telemetry.track_call(stage, model) as rec:
+        return get_scheduler(model).run(_call, estimate_chat_tokens(messages, max_tokens),
+                                        on_retry=rec.on_retry)
+
+
+def compute_cosine_similarity(vec_a, vec_b) -> float:
     """
     Compute the cosine similarity between two vectors.
+    (Scoring many articles at once: see relevance_engine.RelevanceEngine.)
     """
-    if len(vec_a) != len(vec_b):
+    a = np.asarray(vec_a, dtype=np.float32)
+    b = np.asarray(vec_b, dtype=np.float32)
+    if a.shape != b.shape:
         raise ValueError("Vectors must be the same dimension.")
-    dot_product = 0.0
-    norm_a = 0.0
-    norm_b = 0.0
-    for a, b in zip(vec_a, vec_b):
-        dot_product += a * b
-        norm_a += a * a
-        norm_b += b * b
-    if norm_a == 0.0 or norm_b == 0.0:
+    norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+    if norm == 0.0:
         return 0.0
-    return dot_product / (math.sqrt(norm_a) * math.sqrt(norm_b))
+    return float(a @ b) / norm
 
 
 def passes_local_pre_filter(article_text: str,
@@ -95,6 +213,10 @@ def passes_local_pre_filter(article_text: str,
     return sim >= local_threshold
 
 
+def _split_tags(text: str) -> list[str]:
+    return [t.strip() for t in text.split(",") if t.strip()]
+
+
 def generate_tags_multi_step(article_text: str, debug: bool = False) -> list[str]:
     """
     MULTI‑STEP TAG GENERATION via chat API (v1/v0 compatible).
@@ -113,15 +235,20 @@ Text:
         print(step1_prompt)
         print()
 
-    domain_line = _chat_complete(
-        model=getattr(config, "GPT_MODEL_CHAT", "gpt-4o"),
-        messages=[
-            {"role": "system", "content": "You are an expert in identifying the domain or sector of a text."},
-            {"role": "user", "content": step1_prompt},
-        ],
-        temperature=0.3,
-        max_tokens=200
-    ).strip()
+    domain_line = run_cascade(
+        "article_domain",
+        lambda model: _chat_complete(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are an expert in identifying the domain or sector of a text."},
+                {"role": "user", "content": step1_prompt},
+            ],
+            temperature=0.3,
+            max_tokens=200,
+            stage="article_domain",
+        ).strip(),
+        validate=lambda line: plausible_tags(_split_tags(line), min_n=1, max_n=3),
+    )
 
     if debug:
         print("[DEBUG] Step 1 GPT Response (Identified Domain(s)):")
@@ -144,22 +271,27 @@ Text:
         print(step2_prompt)
         print()
 
-    tags_text = _chat_complete(
-        model=getattr(config, "GPT_MODEL_CHAT", "gpt-4o"),
-        messages=[
-            {"role": "system", "content": "You are an expert in generating short keyword tags for a given domain."},
-            {"role": "user", "content": step2_prompt},
-        ],
-        temperature=0.5,
-        max_tokens=200
-    ).strip()
+    tags_text = run_cascade(
+        "article_tags",
+        lambda model: _chat_complete(
+            model=model,
+            messages=[
+                {"role": "system", "content": "You are an expert in generating short keyword tags for a given domain."},
+                {"role": "user", "content": step2_prompt},
+            ],
+            temperature=0.5,
+            max_tokens=200,
+            stage="article_tags",
+        ).strip(),
+        validate=lambda text: plausible_tags(_split_tags(text), min_n=3, max_n=5),
+    )
 
     if debug:
         print("[DEBUG] Step 2 GPT Response (Raw Tags):")
         print(tags_text)
         print()
 
-    final_tags = [t.strip() for t in tags_text.split(",") if t.strip()]
+    final_tags = _split_tags(tags_text)
 
     if debug:
         print("[DEBUG] Final Multi-Step Tags:")
@@ -169,6 +301,60 @@ Text:
     return final_tags
 
 
+_ARTICLE_TAGS_INSTRUCTIONS = """
+You tag defence-industry news articles by topic. For each numbered article
+below give 3-5 short keyword tags capturing its specific topics (programmes,
+platforms, capabilities, sectors, regions).
+Reply with only a JSON object mapping each article number to its list of
+tags, e.g. {"1": ["naval shipbuilding", "submarines", "AUKUS"], "2": [...]}.
+"""
+
+
+def _parse_article_tags(raw: str, n: int) -> list[list[str]]:
+    text = raw.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"article tags are not JSON: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("article tags are not a JSON object")
+    batch = []
+    for i in range(1, n + 1):
+        tags = data.get(str(i)) or []
+        if isinstance(tags, str):
+            tags = _split_tags(tags)
+        batch.append([str(t).strip() for t in tags if str(t).strip()])
+    return batch
+
+
+def generate_article_tags_batch(texts: list[str]) -> list[list[str]]:
+    """
+    3-5 topic tags for each article text, for a whole batch in one chat call
+    (generate_tags_multi_step needs two calls per article).
+    """
+    numbered = "\n\n".join(
+        f"[{i}]\n{truncate_tokens(text, config.ARTICLE_TAG_MAX_TOKENS)}"
+        for i, text in enumerate(texts, 1)
+    )
+    messages = [
+        {"role": "system", "content": _ARTICLE_TAGS_INSTRUCTIONS.strip()},
+        {"role": "user", "content": numbered},
+    ]
+    return run_cascade(
+        "article_batch_tags",
+        lambda model: _parse_article_tags(_chat_complete(
+            model=model,
+            messages=messages,
+            temperature=0.3,
+            max_tokens=40 * len(texts) + 50,
+            stage="article_batch_tags",
+        ), len(texts)),
+        validate=lambda batch: all(plausible_tags(tags, min_n=3, max_n=5) for tags in batch),
+    )
+
+
 def article_is_relevant(article_title: str,
                         article_text: str,
                         solicitation_tags: list[str],
@@ -0,0 +1,206 @@
+# notice_matches.py
+"""
+Persistent notice × article matches, for incremental news matching.
+
+The pipelines register every analysed notice (tags, title, solicitation
+text, insights) in `notice_registry` and record the articles it matched, with their
+impact paragraphs, in `notice_article_matches` — both in the RSS database.
+
+After an ingest, `rss_pull.run_pipeline` calls `match_new_articles` with the
+highest article id seen before the ingest: only the new articles are matched
+against the notices that are still open (seen by a pipeline within
+config.NOTICE_OPEN_DAYS), and only new (notice, article) pairs get an impact
+paragraph.  Frequent feed polling therefore costs a few GPT calls at most.
+
+A pair whose paragraph failed (an error marker or implausible text, see
+`usable_impact`) is stored with a NULL impact: `stored_impacts` leaves it
+out and `match_new_articles` generates it again.
+"""
+import json
+import sqlite3
+import time
+
+import config
+import telemetry
+from gpt_analysis import generate_news_impacts
+from model_router import plausible_paragraph
+from relevance_engine import RelevanceEngine
+
+
+def ensure_tables(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notice_registry (
+            notice_id TEXT PRIMARY KEY,
+            tags      TEXT NOT NULL,
+            title     TEXT NOT NULL DEFAULT '',
+            sol_text  TEXT NOT NULL,
+            insights  TEXT NOT NULL,
+            last_seen REAL NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS notice_article_matches (
+            notice_id  TEXT NOT NULL,
+            article_id INTEGER NOT NULL,
+            score      REAL NOT NULL,
+            impact     TEXT,
+            matched    REAL NOT NULL,
+            PRIMARY KEY (notice_id, article_id)
+        )
+    """)
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(notice_registry)")}
+    if "title" not in columns:
+        conn.execute("ALTER TABLE notice_registry ADD COLUMN title TEXT NOT NULL DEFAULT ''")
+    conn.commit()
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    ensure_tables(conn)
+    return conn
+
+
+def register_notice(notice_id: str,
+                    tags: list[str],
+                    sol_text: str,
+                    insights: str,
+                    title: str = "",
+                    db_path: str = config.DB_NAME) -> None:
+    """Add or refresh an analysed notice; it stays open for NOTICE_OPEN_DAYS."""
+    conn = _connect(db_path)
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO notice_registry (notice_id, tags, title, sol_text, insights, last_seen) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (notice_id, json.dumps(tags), title or "", sol_text, insights, time.time()),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def touch_notices(notice_ids: list[str], db_path: str = config.DB_NAME) -> None:
+    """Keep notices that a pipeline saw again (e.g. from its cache) open."""
+    conn = _connect(db_path)
+    try:
+        conn.executemany("UPDATE notice_registry SET last_seen = ? WHERE notice_id = ?",
+                         [(time.time(), nid) for nid in notice_ids])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def usable_impact(impact) -> bool:
+    """A real impact paragraph, not an "[ERROR ...]" marker or a refusal."""
+    return isinstance(impact, str) and plausible_paragraph(impact)
+
+
+def record_matches(notice_id: str,
+                   scored_articles: list[tuple[dict, float]],
+                   impacts: list[dict],
+                   db_path: str = config.DB_NAME) -> None:
+    """
+    Store (article, score) pairs and their news_impacts rows (same order).
+    Failed paragraphs are stored as NULL, to be generated again.
+    """
+    rows = [
+        (notice_id, art["id"], score,
+         impact.get("impact") if usable_impact(impact.get("impact")) else None, time.time())
+        for (art, score), impact in zip(scored_articles, impacts)
+        if art.get("id") is not None
+    ]
+    conn = _connect(db_path)
+    try:
+        conn.executemany(
+            "INSERT OR REPLACE INTO notice_article_matches "
+            "(notice_id, article_id, score, impact, matched) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def stored_impacts(notice_id: str, db_path: str = config.DB_NAME) -> list[dict]:
+    """All recorded matches of a notice that have an impact, as news_impacts rows, best first."""
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute("""
+            SELECT a.title, a.link, m.score, m.impact
+            FROM notice_article_matches m
+            JOIN rss_articles a ON a.id = m.article_id
+            WHERE m.notice_id = ? AND m.impact IS NOT NULL
+            ORDER BY m.score DESC
+        """, (notice_id,)).fetchall()
+    finally:
+        conn.close()
+    return [
+        {"article_title": title, "article_link": link, "relevance": round(score, 4), "impact": impact}
+        for title, link, score, impact in rows
+    ]
+
+
+def _failed_impacts(conn: sqlite3.Connection, cutoff: float) -> dict[str, list[tuple[dict, float]]]:
+    """Recorded (article, score) pairs of open notices whose impact is NULL, per notice."""
+    rows = conn.execute("""
+        SELECT m.notice_id, a.id, a.title, a.description, a.content_text, a.link, m.score
+        FROM notice_article_matches m
+        JOIN notice_registry n ON n.notice_id = m.notice_id
+        JOIN rss_articles a ON a.id = m.article_id
+        WHERE m.impact IS NULL AND n.last_seen >= ?
+    """, (cutoff,)).fetchall()
+    failed = {}
+    for notice_id, article_id, title, description, content_text, link, score in rows:
+        article = {"id": article_id, "title": title, "description": description,
+                   "content_text": content_text, "link": link}
+        failed.setdefault(notice_id, []).append((article, score))
+    return failed
+
+
+def match_new_articles(since_id: int, db_path: str = config.DB_NAME) -> int:
+    """
+    Match the articles with id > `since_id` against the open notices and
+    generate impacts for the new pairs, plus those of earlier pairs whose
+    impact failed.  Returns the number of new matches.
+    """
+    cutoff = time.time() - config.NOTICE_OPEN_DAYS * 86400
+    conn = _connect(db_path)
+    try:
+        notices = conn.execute(
+            "SELECT notice_id, tags, title, sol_text, insights FROM notice_registry WHERE last_seen >= ?",
+            (cutoff,),
+        ).fetchall()
+        new_ids = {r[0] for r in conn.execute("SELECT id FROM rss_articles WHERE id > ?", (since_id,))}
+        # a new copy of a known story inherits its matches (article_index.cluster_since)
+        recorded = set(conn.execute(
+            "SELECT notice_id, article_id FROM notice_article_matches WHERE article_id > ?", (since_id,)
+        ))
+        failed = _failed_impacts(conn, cutoff)
+    finally:
+        conn.close()
+    if not notices or not (new_ids or failed):
+        return 0
+
+    matches = [[] for _ in notices]
+    if new_ids:
+        engine, candidates = RelevanceEngine.for_notices(
+            [(json.loads(tags), title) for _, tags, title, _, _ in notices], db_path, since_id=since_id
+        )
+        # without BM25 the whole window is loaded; only the new articles may match
+        matches = engine.relevant_many([(json.loads(tags), sol_text) for _, tags, _, sol_text, _ in notices],
+                                       article_ids=new_ids, candidates=candidates)
+    total = 0
+    for (notice_id, _, _, _, insights), scored in zip(notices, matches):
+        telemetry.set_notice(notice_id)
+        try:
+            scored = [(art, score) for art, score in scored if (notice_id, art["id"]) not in recorded]
+            retry = failed.get(notice_id, [])
+            if not scored and not retry:
+                continue
+            impacts = generate_news_impacts(insights, scored + retry, config.company_info)
+            record_matches(notice_id, scored + retry, impacts, db_path)
+            total += len(scored)
+            print(f"📰 {notice_id}: {len(scored)} new matching article(s), {len(retry)} impact(s) retried")
+        except Exception as e:
+            print(f"⚠️ Incremental matching failed for {notice_id}: {e}")
+    return total
@@ -0,0 +1,338 @@
+# relevance_engine.py
+"""
+Vectorised news relevance.
+
+`article_is_relevant` scores one article against one notice's tags with a
+Python loop per tag.  RelevanceEngine instead embeds the article corpus once
+per run into a row-normalised float32 matrix, and scores *every* article for a
+notice with a single matrix-vector product:
+
+    weighted avg_i cos(a, t_i)  ==  â · (Σ_i w_i t̂_i) / Σ_i w_i
+
+with the same N - i tag weights as article_is_relevant, so the scores (and the
+RELEVANCE_THRESHOLD semantics) are unchanged.
+
+`RelevanceEngine.from_index()` takes the article matrix from the vector index
+built at RSS ingest (article_index.py), so a run makes no article embedding
+calls at all.
+
+The TF-IDF pre-filter is fitted once as well: `CorpusTfidf` learns the
+vocabulary and IDF over the whole article corpus (instead of a throwaway
+two-document fit per article × notice pair) and scores a solicitation against
+every article with one sparse product.
+
+Articles tagged at ingest (rss_articles.tags) also allow a cheaper gate in
+front of both: `TagOverlap` keeps, per notice, only the articles whose tags
+share a word with the notice tags, and notices left with no candidate never
+have their tags embedded.
+
+`RelevanceEngine.for_notices()` goes further: each notice's BM25_CANDIDATES
+best full-text matches (FTS5, see article_index.bm25_candidates) are
+retrieved first, and only their union is scored, so the cost follows the
+number of notices rather than the size of the archive.  The TF-IDF is still
+fitted over the whole window (once per window, see `window_tfidf`), so a
+candidate scores the same as it would on the full path.
+"""
+import copy
+import re
+
+import numpy as np
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, CountVectorizer, TfidfVectorizer
+
+import config
+from news_relevance import embed_many, article_text
+import sqlite3
+
+from article_index import load_index, bm25_candidates
+
+
+def _normalise(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    """Stack float32 vectors into a matrix whose rows have unit length."""
+    return _normalise(np.vstack([np.frombuffer(v, dtype=np.float32) for v in vectors]))
+
+
+def tag_weights(n: int) -> np.ndarray:
+    """N, N-1, …, 1 normalised to sum to 1 (earlier tags count more)."""
+    w = np.arange(n, 0, -1, dtype=np.float32)
+    return w / w.sum()
+
+
+class CorpusTfidf:
+    """TF-IDF fitted once over the article texts; rows are L2-normalised."""
+
+    def __init__(self, texts: list[str]):
+        self.vectorizer = TfidfVectorizer(stop_words="english", min_df=1)
+        try:
+            self.matrix = self.vectorizer.fit_transform(texts)      # sparse, n_articles × vocab
+        except ValueError as e:                                     # empty vocabulary
+            print(f"⚠️ TF-IDF pre-filter disabled: {e}")
+            self.matrix = None
+        self.n = len(texts)
+
+    def similarities(self, text: str) -> np.ndarray:
+        """Cosine similarity of `text` to every article (one sparse product)."""
+        return self.similarity_matrix([text])[0]
+
+    def similarity_matrix(self, texts: list[str]) -> np.ndarray:
+        """texts × articles cosine similarities."""
+        if self.matrix is None:
+            return np.zeros((len(texts), self.n), dtype=np.float32)
+        queries = self.vectorizer.transform(texts)
+        return (queries @ self.matrix.T).toarray()
+
+    def subset(self, rows) -> "CorpusTfidf":
+        """The same fit restricted to the articles at `rows` (IDF stays corpus-wide)."""
+        sub = copy.copy(self)
+        sub.matrix = None if self.matrix is None else self.matrix[rows]
+        sub.n = len(rows)
+        return sub
+
+
+# (db_path, model) -> (article ids, CorpusTfidf) of the last window fitted
+_WINDOW_TFIDF: dict[tuple, tuple[tuple, CorpusTfidf]] = {}
+
+
+def window_tfidf(db_path: str, model: str | None, articles: list[dict]) -> CorpusTfidf:
+    """
+    TF-IDF over the lookback window `articles` (load_index order), refitted
+    only when the window's article ids change, i.e. after an ingest.
+    """
+    ids = tuple(a["id"] for a in articles)
+    cached = _WINDOW_TFIDF.get((db_path, model))
+    if cached is None or cached[0] != ids:
+        cached = (ids, CorpusTfidf([article_text(a) for a in articles]))
+        _WINDOW_TFIDF[(db_path, model)] = cached
+    return cached[1]
+
+
+def _tag_words(text: str) -> list[str]:
+    """Lower-cased tag words without stop words or a plural "s" (submarines → submarine)."""
+    words = re.findall(r"[a-z0-9]{2,}", text.lower())
+    return [w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w
+            for w in words if w not in ENGLISH_STOP_WORDS]
+
+
+class TagOverlap:
+    """Shared tag words between notices and the ingest-time article tags."""
+
+    def __init__(self, article_tags: list[str | None]):
+        self.untagged = np.array([not tags for tags in article_tags], dtype=bool)
+        self.vectorizer = CountVectorizer(binary=True, analyzer=_tag_words)
+        try:
+            self.matrix = self.vectorizer.fit_transform([tags or "" for tags in article_tags])
+        except ValueError:                                          # nothing tagged yet
+            self.matrix = None
+
+    def mask(self, tag_lists: list[list[str]], min_overlap: int) -> np.ndarray:
+        """notices × articles: True where the overlap is large enough or the article is untagged."""
+        if self.matrix is None:
+            return np.ones((len(tag_lists), len(self.untagged)), dtype=bool)
+        queries = self.vectorizer.transform([" ".join(tags) for tags in tag_lists])
+        return ((queries @ self.matrix.T).toarray() >= min_overlap) | self.untagged
+
+
+class RelevanceEngine:
+    def __init__(self, articles: list[dict], model: str | None = None,
+                 matrix: np.ndarray | None = None, tfidf: CorpusTfidf | None = None):
+        """
+        `matrix` (one row per article) skips embedding the articles here;
+        `tfidf` (rows in article order) replaces the fit over `articles`.
+        """
+        self.articles = articles
+        self.model = model
+        self.texts = [article_text(a) for a in articles]
+        if not articles:
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+        elif matrix is not None:
+            self.matrix = _normalise(matrix.astype(np.float32, copy=False))
+        else:
+            self.matrix = _unit_rows(embed_many(self.texts, model))
+        self._tfidf = tfidf
+        self._tag_overlap = None
+
+    @property
+    def tfidf(self) -> CorpusTfidf:
+        """Corpus TF-IDF, fitted on first use (unless given) and shared by every notice."""
+        if self._tfidf is None:
+            self._tfidf = CorpusTfidf(self.texts)
+        return self._tfidf
+
+    @property
+    def tag_overlap(self) -> TagOverlap:
+        if self._tag_overlap is None:
+            self._tag_overlap = TagOverlap([a.get("tags") for a in self.articles])
+        return self._tag_overlap
+
+    @classmethod
+    def from_index(cls, db_path: str = config.DB_NAME, model: str | None = None) -> "RelevanceEngine":
+        """Engine over the recent articles of the ingest-time vector index."""
+        articles, matrix = load_index(db_path, model)
+        return cls(articles, model, matrix, window_tfidf(db_path, model, articles))
+
+    @classmethod
+    def for_notices(cls,
+                    notices: list[tuple[list[str], str]],
+                    db_path: str = config.DB_NAME,
+                    model: str | None = None,
+                    since_id: int = 0) -> tuple["RelevanceEngine", list[set] | None]:
+        """
+        Engine over the BM25 candidates of `notices` ((tags, title) pairs) and
+        the per-notice candidate id sets to pass to `relevant_many`.  Its
+        TF-IDF rows come from the whole window's fit.  Without BM25_RETRIEVAL
+        (or FTS5) this is `from_index` with no candidate sets.
+        """
+        if config.BM25_RETRIEVAL:
+            try:
+                conn = sqlite3.connect(db_path)
+                try:
+                    candidates = [
+                        set(bm25_candidates(conn, (tags if isinstance(tags, list) else []) + [title],
+                                            config.BM25_CANDIDATES, since_id))
+                        for tags, title in notices
+                    ]
+                finally:
+                    conn.close()
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ BM25 retrieval unavailable ({e}); scoring the whole window")
+            else:
+                articles, matrix = load_index(db_path, model)
+                tfidf = window_tfidf(db_path, model, articles)
+                rows = np.flatnonzero(np.isin([a["id"] for a in articles], list(set().union(*candidates))))
+                print(f"📚 BM25: {len(rows)} candidate article(s) for {len(notices)} notice(s)")
+                return cls([articles[i] for i in rows], model, matrix[rows], tfidf.subset(rows)), candidates
+        return cls.from_index(db_path, model), None
+
+    def __len__(self) -> int:
+        return len(self.articles)
+
+    def tag_query(self, tags: list[str]) -> np.ndarray:
+        """Weighted sum of the unit tag vectors — one query vector per notice."""
+        return tag_weights(len(tags)) @ _unit_rows(embed_many(tags, self.model))
+
+    def scores(self, tags: list[str]) -> np.ndarray:
+        """Weighted-average cosine similarity of every article to `tags`."""
+        if not tags or not self.articles:
+            return np.zeros(len(self.articles), dtype=np.float32)
+        return self.matrix @ self.tag_query(tags)
+
+    def score_matrix(self, tag_lists: list[list[str]]) -> np.ndarray:
+        """
+        notices × articles scores for several notices at once: every distinct
+        tag is embedded in one call and all scores come from one matrix product.
+        Notices without tags score 0 everywhere.
+        """
+        if not self.articles:
+            return np.zeros((len(tag_lists), 0), dtype=np.float32)
+        distinct = sorted({t for tags in tag_lists for t in tags})
+        queries = np.zeros((len(tag_lists), self.matrix.shape[1]), dtype=np.float32)
+        if distinct:
+            unit = dict(zip(distinct, _unit_rows(embed_many(distinct, self.model))))
+            for q, tags in enumerate(tag_lists):
+                if tags:
+                    queries[q] = tag_weights(len(tags)) @ np.vstack([unit[t] for t in tags])
+        return queries @ self.matrix.T
+
+    def top_k(self, tags: list[str], k: int) -> list[tuple[dict, float]]:
+        """The `k` nearest articles to `tags` as (article, score), best first."""
+        scores = self.scores(tags)
+        if not len(scores):
+            return []
+        k = min(k, len(scores))
+        idx = np.argpartition(-scores, k - 1)[:k]
+        idx = idx[np.argsort(-scores[idx])]
+        return [(self.articles[i], float(scores[i])) for i in idx]
+
+    def relevant(self,
+                 tags,
+                 solicitation_text: str,
+                 threshold: float | None = None,
+                 local_threshold: float | None = None,
+                 limit: int | None = None,
+                 article_ids: set | None = None,
+                 debug: bool = False,
+                 candidates: set | None = None) -> list[tuple[dict, float]]:
+        """
+        (article, score) for the articles whose embedding score reaches
+        `threshold` and whose corpus TF-IDF similarity to `solicitation_text`
+        reaches `local_threshold` (config.LOCAL_PREFILTER_THRESHOLD by
+        default), best first and capped at `limit` (config.NEWS_IMPACT_TOP_K).
+        `article_ids` restricts the result to those articles, `candidates`
+        likewise (for_notices' per-notice BM25 set).
+        """
+        return self.relevant_many([(tags, solicitation_text)], threshold, local_threshold,
+                                  limit, article_ids, debug,
+                                  None if candidates is None else [candidates])[0]
+
+    def relevant_many(self,
+                      queries: list[tuple[list[str], str]],
+                      threshold: float | None = None,
+                      local_threshold: float | None = None,
+                      limit: int | None = None,
+                      article_ids: set | None = None,
+                      debug: bool = False,
+                      candidates: list[set] | None = None) -> list[list[tuple[dict, float]]]:
+        """
+        `relevant` for many (tags, solicitation_text) queries in one pass: the
+        full notices × articles embedding and TF-IDF matrices are computed up
+        front, then each row is thresholded.  With `debug` every
+        (notice, article) pair's two scores are printed.  `candidates` holds
+        one article id set per query (see for_notices).
+        """
+        if threshold is None:
+            threshold = getattr(config, "RELEVANCE_THRESHOLD", 0.75)
+        if local_threshold is None:
+            local_threshold = config.LOCAL_PREFILTER_THRESHOLD
+        if limit is None:
+            limit = config.NEWS_IMPACT_TOP_K
+        tag_lists = [tags if isinstance(tags, list) else [] for tags, _ in queries]
+        if not self.articles or not any(tag_lists):
+            return [[] for _ in queries]
+        # cheap gates first: BM25 candidates and tag-word overlap
+        ids = np.array([a.get("id") for a in self.articles])
+        allowed = np.ones((len(queries), len(self.articles)), dtype=bool)
+        if candidates is not None:
+            allowed = np.vstack([np.isin(ids, list(cand)) for cand in candidates])
+        if config.ARTICLE_TAG_PREFILTER:
+            allowed &= self.tag_overlap.mask(tag_lists, config.TAG_OVERLAP_MIN)
+        # a notice with no article left needs no embedding
+        tag_lists = [tags if allowed[q].any() else [] for q, tags in enumerate(tag_lists)]
+        try:
+            scores = self.score_matrix(tag_lists)
+        except Exception as e:
+            print(f"⚠️ Relevance scoring failed: {e}")
+            return [[] for _ in queries]
+
+        above = scores >= threshold
+        similarity = self.tfidf.similarity_matrix([text for _, text in queries])
+        lexical = similarity >= local_threshold
+        keep = above & lexical & allowed
+        if article_ids is not None:
+            keep &= np.isin(ids, list(article_ids))
+
+        results = []
+        for q, tags in enumerate(tag_lists):
+            if not tags:
+                results.append([])
+                continue
+            if debug:
+                self._print_pairs(q, scores[q], similarity[q], keep[q], threshold, local_threshold)
+            matched = np.flatnonzero(keep[q])
+            ranked = matched[np.argsort(-scores[q, matched], kind="stable")][:limit]
+            print(f"🔎 {len(matched)} of {len(self.articles)} articles relevant "
+                  f"({int(allowed[q].sum())} past BM25/tag gates, {int(above[q].sum())} above "
+                  f"{threshold:.3f}, {int(lexical[q].sum())} past TF-IDF); "
+                  f"keeping top {len(ranked)}")
+            results.append([(self.articles[i], float(scores[q, i])) for i in ranked])
+        return results
+
+    def _print_pairs(self, q, scores, similarity, keep, threshold, local_threshold) -> None:
+        for i, art in enumerate(self.articles):
+            verdict = "PASSED" if keep[i] else "FAILED"
+            print(f"[DEBUG] notice #{q} × {art.get('title', '')[:60]!r}: "
+                  f"embedding {scores[i]:.4f} (threshold={threshold}), "
+                  f"TF-IDF {similarity[i]:.4f} (threshold={local_threshold}) → {verdict}")
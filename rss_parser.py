@@ -1,7 +1,72 @@
 # rss_parser.py
+import datetime
+import io
+import sqlite3
 import xml.etree.ElementTree as ET
+from email.utils import parsedate_to_datetime
+
 import config
-import sqlite3
+
+_CONTENT_ENCODED = "{%s}encoded" % config.XML_NAMESPACES["content"]
+_DC_DATE = "{http://purl.org/dc/elements/1.1/}date"
+
+
+def _text(item, tag: str) -> str:
+    return (item.findtext(tag) or "").strip()
+
+
+def _pub_date(item) -> str | None:
+    """pubDate (RFC 822) or dc:date (ISO 8601) as a UTC "YYYY-MM-DD HH:MM:SS" for SQLite."""
+    raw = _text(item, "pubDate")
+    try:
+        dt = parsedate_to_datetime(raw) if raw else datetime.datetime.fromisoformat(_text(item, _DC_DATE))
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc)
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _item_fields(item) -> dict:
+    return {
+        "title": _text(item, "title"),
+        "link": _text(item, "link"),
+        "description": _text(item, "description"),
+        "pub_date": _pub_date(item),
+        "guid": _text(item, "guid"),
+        "categories": ", ".join(c.text.strip() for c in item.findall("category") if c.text),
+        "content_encoded": _text(item, _CONTENT_ENCODED),
+    }
+
+
+def iter_rss_items(source):
+    """
+    Stream the <item>s of an RSS 2.0 feed in one pass.
+
+    `source` is the raw feed (bytes/str) or a file path.  Each item is read
+    with all its fields — title, link, description, pub_date, guid,
+    categories, content_encoded — from the same element, then dropped from
+    the tree, so memory stays bounded by one item however long the feed is.
+    A malformed document ends the stream after the last complete item.
+    """
+    if isinstance(source, str) and source.lstrip().startswith("<"):
+        source = source.encode("utf-8")
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    parents = []
+    try:
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            if event == "start":
+                parents.append(elem)
+                continue
+            parents.pop()
+            if elem.tag == "item":
+                yield _item_fields(elem)
+                if parents:
+                    parents[-1].remove(elem)
+    except ET.ParseError as e:
+        print(f"⚠️ RSS parse error, stopping after the last complete item: {e}")
 
 
 def parse_rss_feed(rss_file_path: str) -> list[dict]:
@@ -22,62 +87,46 @@ def parse_rss_feed(rss_file_path: str) -> list[dict]:
       - "description": str
       - "content": str (the text/HTML under <content:encoded> if present)
     """
-    articles = []
     try:
-        tree = ET.parse(rss_file_path)
-    except Exception as e:
-        print(f"⚠️ Error parsing RSS file {rss_file_path}: {e}")
-        return articles
-
-    root = tree.getroot()
-    channel = root.find("channel")
-    if channel is None:
-        print(f"⚠️ RSS file {rss_file_path} does not contain a <channel> element.")
-        return articles
-
-    for item in channel.findall("item"):
-        title = item.findtext("title", default="No Title").strip()
-        link = item.findtext("link", default="No Link").strip()
-        description = item.findtext("description", default="No Description").strip()
-        
-        # For the <content:encoded> node, we look up the config-defined namespace
-        content_node = item.find("{http://purl.org/rss/1.0/modules/content/}encoded")
-        # if you prefer using config.XML_NAMESPACES, you can do:
-        # content_node = item.find("content:encoded", config.XML_NAMESPACES)
-        
-        content_text = content_node.text.strip() if (content_node is not None and content_node.text) else ""
-
-        articles.append({
-            "title": title,
-            "link": link,
-            "description": description,
-            "content": content_text
-        })
-
-    return articles
+        items = list(iter_rss_items(rss_file_path))
+    except OSError as e:
+        print(f"⚠️ Error reading RSS file {rss_file_path}: {e}")
+        return []
 
-
-def load_articles_from_db(db_path=config.DB_NAME):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Select only articles from the past 1 month based on pub_date
-    cursor.execute("""
-        SELECT title, description, content_encoded, link 
-        FROM rss_articles
-        WHERE pub_date >= datetime('now', '-1 month')
-    """)
-    rows = cursor.fetchall()
-    conn.close()
-
-    articles = [
+    return [
         {
-            "title": row[0],
-            "description": row[1],
-            "content_encoded": row[2],
-            "link": row[3]
+            "title": item["title"] or "No Title",
+            "link": item["link"] or "No Link",
+            "description": item["description"] or "No Description",
+            "content": item["content_encoded"],
         }
-        for row in rows
+        for item in items
     ]
-    return articles
 
+
+# ---------- reading articles back -------------------------------------------
+# (db_path, columns) -> (window_key, articles); see load_articles_from_db
+_ARTICLE_CACHE: dict[tuple, tuple[tuple, list[dict]]] = {}
+
+
+def load_articles_from_db(db_path=config.DB_NAME, columns: tuple[str, ...] | None = None) -> list[dict]:
+    """
+    Articles of the lookback window as dicts of `columns` (default: everything
+    but the HTML, see article_index.ARTICLE_COLUMNS), read a page at a time
+    and cached per process until a new article is ingested or the day rolls
+    over.  Callers must not mutate the returned dicts.
+    """
+    from article_index import ARTICLE_COLUMNS, iter_articles, window_key     # keeps feed parsing light
+
+    columns = tuple(columns or ARTICLE_COLUMNS + ("content_text",))
+    conn = sqlite3.connect(db_path)
+    try:
+        key = window_key(conn)
+        cached = _ARTICLE_CACHE.get((db_path, columns))
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        articles = list(iter_articles(conn, columns))
+    finally:
+        conn.close()
+    _ARTICLE_CACHE[(db_path, columns)] = (key, articles)
+    return articles
@@ -2,11 +2,13 @@
 
 import sqlite3
 import requests
-import feedparser
 import time
-import xml.etree.ElementTree as ET
-import datetime
-from time import mktime
+
+import config
+from rss_parser import iter_rss_items
+from article_index import (index_missing, tag_missing, ensure_schema, fts_index_since, plain_text,
+                           compress_html, cluster_since)
+from notice_matches import match_new_articles
 
 # Define RSS feed categories and base URL
 BASE_URL = "https://www.defensenews.com/arc/outboundfeeds/rss"
@@ -36,47 +38,130 @@ def setup_database(db_name="rss_data7.db"):
             description TEXT,
             guid TEXT,
             categories TEXT,
-            content_encoded TEXT
+            content_text TEXT,
+            content_html BLOB
         );
         """)
         conn.commit()
+    migrate_unique_keys(conn)
+    migrate_content_storage(conn)
+    ensure_schema(conn)
 
     return conn
 
+
+def _table_exists(conn, name):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type IN ('table', 'index') AND name = ?", (name,)
+    ).fetchone() is not None
+
+
+def migrate_unique_keys(conn):
+    """
+    One-off migration: drop duplicate link / guid rows (keeping the oldest),
+    clean up what pointed at them, and add unique indexes so the database
+    itself rejects duplicates.  Empty links/guids are left out of the indexes.
+    """
+    if _table_exists(conn, "ux_rss_articles_link"):
+        return
+    with conn:
+        removed = 0
+        for col in ("link", "guid"):
+            removed += conn.execute(f"""
+                DELETE FROM rss_articles
+                WHERE {col} <> '' AND id NOT IN (
+                    SELECT MIN(id) FROM rss_articles WHERE {col} <> '' GROUP BY {col}
+                )
+            """).rowcount
+        for table, key in (("article_vectors", "article_id"),
+                           ("notice_article_matches", "article_id"),
+                           ("rss_articles_fts", "rowid")):
+            if _table_exists(conn, table):
+                conn.execute(f"DELETE FROM {table} WHERE {key} NOT IN (SELECT id FROM rss_articles)")
+        conn.execute("CREATE UNIQUE INDEX ux_rss_articles_link ON rss_articles(link) WHERE link <> ''")
+        conn.execute("CREATE UNIQUE INDEX ux_rss_articles_guid ON rss_articles(guid) WHERE guid <> ''")
+    if removed:
+        print(f"🧹 Removed {removed} duplicate article(s) before adding unique indexes.")
+
+def _drop_column(conn, column):
+    try:
+        conn.execute(f"ALTER TABLE rss_articles DROP COLUMN {column}")
+    except sqlite3.OperationalError:     # SQLite < 3.35: keep the column, empty
+        conn.execute(f"UPDATE rss_articles SET {column} = NULL")
+
+
+def migrate_content_storage(conn):
+    """
+    One-off migration from the raw `content_encoded` HTML column to
+    `content_text` (plain text for analysis) + `content_html` (the same HTML,
+    zlib-compressed).  Descriptions are left as stored.  The old column is
+    dropped, the FTS index is left for ensure_fts to rebuild over the new
+    column, and the file is vacuumed so the database actually shrinks.
+    """
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(rss_articles)")}
+    with conn:
+        for column, kind in (("content_text", "TEXT"), ("content_html", "BLOB")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE rss_articles ADD COLUMN {column} {kind}")
+        if "content_encoded" not in columns:
+            return
+        rows = conn.execute(
+            "SELECT id, content_encoded FROM rss_articles WHERE content_encoded IS NOT NULL"
+        ).fetchall()
+        conn.executemany(
+            "UPDATE rss_articles SET content_text = ?, content_html = ? WHERE id = ?",
+            [(plain_text(body), compress_html(body), i) for i, body in rows],
+        )
+        _drop_column(conn, "content_encoded")
+        if rows:
+            conn.execute("DROP TABLE IF EXISTS rss_articles_fts")
+    if rows:
+        conn.execute("VACUUM")
+        print(f"🗜️ Moved {len(rows)} article bodies to plain text + compressed HTML.")
+
 ########################################################################
 # Insert Article into DB
 ########################################################################
 
 def insert_articles(conn, feed_name, articles):
-    cur = conn.cursor()
-
-    for article in articles:
-        title = article.get("title", "")
-        link = article.get("link", "")
-        description = article.get("description", "")
-        pub_date = article.get("pub_date", "")
-        guid = article.get("guid", "")
-        categories = article.get("categories", "")
-        content_encoded = article.get("content_encoded", "")
-
-        # Skip if already exists
-        cur.execute("""
-            SELECT 1 FROM rss_articles WHERE link = ? OR guid = ? LIMIT 1
-        """, (link, guid))
-        if cur.fetchone():
-            continue
-
-        cur.execute("""
-            INSERT INTO rss_articles (
+    """
+    Insert the articles in one transaction; rows whose link or guid is
+    already stored are ignored by the unique indexes.  Bodies are stored as
+    plain text (markup and boilerplate stripped) and as compressed HTML, and
+    new rows are assigned to their near-duplicate cluster.  Returns how
+    many rows were actually new.
+    """
+    rows = [
+        (
+            feed_name,
+            article.get("title", ""),
+            article.get("link", ""),
+            article.get("pub_date", ""),
+            article.get("description", ""),
+            article.get("guid", ""),
+            article.get("categories", ""),
+            plain_text(article.get("content_encoded", "")),
+            compress_html(article.get("content_encoded", "")),
+        )
+        for article in articles
+    ]
+    with conn:
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM rss_articles").fetchone()[0]
+        changes = conn.total_changes
+        conn.executemany("""
+            INSERT OR IGNORE INTO rss_articles (
                 feed_name, title, link, pub_date, description,
-                guid, categories, content_encoded
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            feed_name, title, link, pub_date, description,
-            guid, categories, content_encoded
-        ))
-
-    conn.commit()
+                guid, categories, content_text, content_html
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        # ignored rows can still use up AUTOINCREMENT ids, so count changes rather than ids
+        new = conn.total_changes - changes
+        cluster_since(conn, last_id)
+        try:
+            fts_index_since(conn, last_id)
+        except sqlite3.OperationalError as e:
+            print(f"⚠️ Full-text index not updated: {e}")
+    return new
 
 ########################################################################
 # RSS Feed URL and Parser
@@ -92,62 +177,23 @@ def fetch_feed_content(slug):
     return resp.content
 
 def parse_feed(feed_content):
-    feed = feedparser.parse(feed_content)
-    articles = []
-
-    try:
-        root = ET.fromstring(feed_content)
-        items = root.findall(".//item")
-    except ET.ParseError:
-        items = []
-
-    for i, entry in enumerate(feed.entries):
-        title = entry.get("title", "")
-        link = entry.get("link", "")
-        description = entry.get("description", "")
-
-        # Normalize pub_date to ISO 8601 for SQLite
-        if hasattr(entry, "published_parsed") and entry.published_parsed:
-            dt = datetime.datetime.fromtimestamp(mktime(entry.published_parsed))
-            pub_date = dt.strftime("%Y-%m-%d %H:%M:%S")
-        else:
-            raw = entry.get("published", "") or entry.get("pubDate", "")
-            try:
-                dt = datetime.datetime.strptime(raw, "%a, %d %b %Y %H:%M:%S %z")
-                pub_date = dt.strftime("%Y-%m-%d %H:%M:%S")
-            except Exception:
-                pub_date = None
-
-        guid = entry.get("id", "") or entry.get("guid", "")
-        categories = ", ".join([tag.term for tag in entry.tags]) if "tags" in entry else ""
-
-        content_encoded = ""
-        try:
-            content_encoded = items[i].find(
-                "{http://purl.org/rss/1.0/modules/content/}encoded"
-            ).text or ""
-        except Exception:
-            pass
-
-        articles.append({
-            "title": title,
-            "link": link,
-            "description": description,
-            "pub_date": pub_date,
-            "guid": guid,
-            "categories": categories,
-            "content_encoded": content_encoded
-        })
-
-    return articles
+    """Articles of one fetched feed (single streaming pass, see rss_parser.iter_rss_items)."""
+    return list(iter_rss_items(feed_content))
 
 ########################################################################
 # Main Pipeline
 ########################################################################
 
+def _collapsed(conn):
+    """Articles hidden behind a newer copy of the same story (see article_index.cluster_since)."""
+    return conn.execute("SELECT COUNT(*) FROM rss_articles WHERE cluster_id <> id").fetchone()[0]
+
+
 def run_pipeline(db_name="rss_data7.db"):
     start_time = time.time()
     conn = setup_database(db_name)
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM rss_articles").fetchone()[0]
+    collapsed = _collapsed(conn)
 
     for slug in SECTION_SLUGS:
         feed_name = slug if slug else "homepage"
@@ -156,12 +202,37 @@ def run_pipeline(db_name="rss_data7.db"):
         try:
             content = fetch_feed_content(slug)
             articles = parse_feed(content)
-            insert_articles(conn, feed_name, articles)
-            print(f"✅ Inserted {len(articles)} articles from '{feed_name}'.")
+            new = insert_articles(conn, feed_name, articles)
+            print(f"✅ Inserted {new} new of {len(articles)} articles from '{feed_name}'.")
         except Exception as e:
             print(f"❌ Error processing feed '{feed_name}': {e}")
 
+    dupes = _collapsed(conn) - collapsed
+    if dupes:
+        print(f"🧬 {dupes} new article(s) are near-duplicates of stories already stored.")
+
+    if config.INDEX_ARTICLES_AT_INGEST:
+        try:
+            n = index_missing(conn)
+            print(f"🧭 Embedded {n} new article(s) into the vector index.")
+        except Exception as e:
+            print(f"⚠️ Could not update the article vector index: {e}")
+
+    if config.TAG_ARTICLES_AT_INGEST:
+        try:
+            n = tag_missing(conn)
+            print(f"🏷️ Tagged {n} new article(s).")
+        except Exception as e:
+            print(f"⚠️ Could not tag new articles: {e}")
+
     conn.close()
+
+    if config.INCREMENTAL_NEWS_MATCHING:
+        try:
+            n = match_new_articles(last_id, db_name)
+            print(f"📰 {n} new notice/article match(es).")
+        except Exception as e:
+            print(f"⚠️ Incremental news matching failed: {e}")
     print(f"\n✅ All feeds processed in {time.time() - start_time:.2f} seconds.")
 
 ########################################################################
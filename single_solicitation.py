@@ -1,6 +1,8 @@
 # single_solicitation.py
 import json
 import time
+import queue
+import threading
 
 import re
 from urllib.parse import urlparse, parse_qs
@@ -18,10 +20,13 @@ from gpt_analysis import (
     generate_insights,
     generate_swot_analysis,
     generate_solicitation_tags,
-    generate_news_impact_paragraph
+    generate_news_impact_paragraph,
+    generate_news_impacts,
+    generate_structured_analysis,
+    structured_to_row_fields,
 )
-from rss_parser import load_articles_from_db
-from news_relevance import article_is_relevant
+from relevance_engine import RelevanceEngine
+import telemetry
 
 
 # ─────────────────────────────────────────────────────────────────────────────
@@ -73,12 +78,25 @@ def _parse_sam_id(url: str) -> str | None:
     m = re.search(r"/opp/([^/]+)/view", url)
     return m.group(1) if m else None
 # ────────────────────────────────────────────────────────────────────────────
-def process_single_url(url: str) -> dict:
+def process_single_url(url: str, on_event=None) -> dict:
+    """
+    Analyse one SAM.gov / EU Tenders URL and return its row.
+
+    `on_event(event)` (optional) receives progress as it happens:
+      {"type": "meta",  "info": {...}}                       basic info
+      {"type": "stage", "stage": s, "status": "start"|"done", "result": ...}
+      {"type": "text",  "stage": s, "text": text_so_far}     streamed tokens
+      {"type": "impact", "index": n, "status": "start"|"done", "article_title",
+       "article_link", "impact"}                             per news impact
+    where streamed impact text uses stage "impact:<n>".
+    """
     url = url.strip()
+    telemetry.start_run("single")
+    telemetry.set_notice(url)
 
     # 1) SAM link?
     if _is_sam_url(url):
-        return _process_sam_link(url)
+        return _process_sam_link(url, on_event)
 
     # 2) GUID‐style EU link ("/tender-details/<GUID>-CN?…")
     elif _is_eu_guid_url(url):
@@ -87,26 +105,137 @@ def process_single_url(url: str) -> dict:
             "https://ec.europa.eu/info/funding-tenders/opportunities/portal/"
             f"screen/opportunities/call-details?reference={ref_guid}"
         )
-        return _process_eu_link(eu_ref_url)
+        return _process_eu_link(eu_ref_url, on_event)
 
     # 3) Already‐formatted "call-details?reference=<…>" link
     elif _is_eu_url(url):
-        return _process_eu_link(url)
+        return _process_eu_link(url, on_event)
 
     # 4) Not recognized
     else:
         raise ValueError(f"URL does not appear to be a SAM or EU Tenders opportunity: {url}")
 
+
+def stream_single_url(url: str):
+    """
+    Generator over process_single_url's events, ending with
+    {"type": "done", "row": row} or {"type": "error", "error": message}.
+
+    The work runs on a background thread and events cross over a queue, so the
+    caller (e.g. a Streamlit script) can render them on its own thread.
+    """
+    events: queue.Queue = queue.Queue()
+
+    def _worker():
+        try:
+            row = process_single_url(url, on_event=events.put)
+            events.put({"type": "done", "row": row})
+        except Exception as e:
+            events.put({"type": "error", "error": str(e)})
+
+    threading.Thread(target=_worker, daemon=True).start()
+    while True:
+        event = events.get()
+        yield event
+        if event["type"] in ("done", "error"):
+            return
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# 1b) Shared GPT + news-impact steps (identical for SAM and EU rows)
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _analyse(_safe_call, emit, content_for_gpt: str, description: str,
+             description_byte: str, attachments: list[str], sol_text: str, title: str = ""):
+    """
+    Run insights / SWOT / tags (or the single-pass call) and the news-impact
+    loop, emitting stage and streamed-text events along the way.
+    Returns (fields, insights, swot, tags, news_impacts).
+    """
+    def _streamer(stage):
+        return lambda text: emit({"type": "text", "stage": stage, "text": text})
+
+    def _stage(stage, fn, *args, **kwargs):
+        emit({"type": "stage", "stage": stage, "status": "start"})
+        result = _safe_call(fn, *args, **kwargs)
+        emit({"type": "stage", "stage": stage, "status": "done", "result": result})
+        return result
+
+    fields = {}
+    if config.GPT_SINGLE_PASS_ANALYSIS:
+        fields = structured_to_row_fields(_stage("analysis",
+                                                 generate_structured_analysis,
+                                                 content_for_gpt,
+                                                 description,
+                                                 description_byte,
+                                                 attachments,
+                                                 config.company_info))
+        insights, swot, tags = fields["insights"], fields["swot"], fields["tags"]
+        for stage, result in (("insights", insights), ("swot", swot), ("tags", tags)):
+            emit({"type": "stage", "stage": stage, "status": "done", "result": result})
+    else:
+        insights = _stage("insights", generate_insights,
+                          content_for_gpt,
+                          description,
+                          description_byte,
+                          attachments,
+                          on_text=_streamer("insights"))
+
+        swot = _stage("swot", generate_swot_analysis,
+                      content_for_gpt,
+                      description,
+                      description_byte,
+                      insights,
+                      config.company_info,
+                      on_text=_streamer("swot"))
+
+        tags = _stage("tags", generate_solicitation_tags,
+                      content_for_gpt,
+                      description,
+                      insights)
+
+    news_impacts: list[dict] = []
+    if isinstance(tags, list):
+        emit({"type": "stage", "stage": "news", "status": "start"})
+        # BM25 candidates with their precomputed vectors (as in run_sam_pipeline)
+        engine, candidates = RelevanceEngine.for_notices([(tags, title)])
+        scored = engine.relevant(tags, sol_text, candidates=None if candidates is None else candidates[0])
+        # announce every article up front (in rank order); the paragraphs are
+        # generated concurrently and only reach the UI through `emit`
+        for n, (art, score) in enumerate(scored):
+            emit({"type": "impact", "index": n, "status": "start",
+                  "article_title": art["title"], "article_link": art["link"]})
+
+        def _impact(n, art):
+            impact_paragraph = _safe_call(
+                generate_news_impact_paragraph,
+                insights,
+                art,
+                config.company_info,
+                on_text=_streamer(f"impact:{n}")
+            )
+            emit({"type": "impact", "index": n, "status": "done",
+                  "article_title": art["title"], "article_link": art["link"],
+                  "impact": impact_paragraph})
+            return impact_paragraph
+
+        news_impacts = generate_news_impacts(insights, scored, config.company_info, generate=_impact)
+        emit({"type": "stage", "stage": "news", "status": "done", "result": news_impacts})
+
+    return fields, insights, swot, tags, news_impacts
+
 # ─────────────────────────────────────────────────────────────────────────────
 # 2) Core logic to process a SAM.gov link
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _process_sam_link(url: str) -> dict:
+def _process_sam_link(url: str, on_event=None) -> dict:
     """
     For a given SAM.gov opportunity URL, fetch that one bid’s metadata,
     fetch & filter attachments, then call GPT‐analysis steps.
     Returns a dict that mirrors one row of your SAM pipeline output.
     """
+    emit = on_event or (lambda event: None)
+
     # 2.1) Extract the SAM ID from the URL
     sam_id = _parse_sam_id(url)
     if not sam_id:
@@ -130,7 +259,11 @@ def _process_sam_link(url: str) -> dict:
         except Exception:
             description = ""
 
+    emit({"type": "meta", "info": {"title": title, "status": status, "source": "SAM.gov",
+                                   "naics": naics_code, "solicitation": solicitation_number}})
+
     # 2.3) Download attachments
+    emit({"type": "stage", "stage": "attachments", "status": "start"})
     attachment_paths: list[str] = []
     att_json = sam_get_attachments(sam_id)
     if att_json and "_embedded" in att_json:
@@ -151,8 +284,12 @@ def _process_sam_link(url: str) -> dict:
     if attachments:
         attachments_text = extract_text_from_files(attachments)
 
-    # 2.6) Build the "content_for_gpt" exactly as your SAM pipeline did:
-    content_for_gpt = attachments_text if attachments else description
+    emit({"type": "stage", "stage": "attachments", "status": "done", "result": attachments})
+
+    # 2.6) Build the "content_for_gpt" exactly as your SAM pipeline did: the attachments
+    #      reach GPT through extract_text_from_files (map-reduced when oversized), so the
+    #      prompts' own content is the description only
+    content_for_gpt = description
 
     # 2.7) Run GPT steps with safe‐retry wrapper (reuse your existing logic for SAM)
     #      We’ll inline a minimal “retry‐once” guard, just like main_sam.py did.
@@ -168,47 +305,14 @@ def _process_sam_link(url: str) -> dict:
                     return f"[ERROR after {MAX_GPT_RETRIES} tries: {e}]"
                 time.sleep(2)
 
-    insights = _safe_call(generate_insights,
-                          content_for_gpt,
-                          description,
-                          "",     # SAM’s code passed empty string for description_byte
-                          attachments)
-
-    swot = _safe_call(generate_swot_analysis,
-                      content_for_gpt,
-                      description,
-                      "",
-                      insights,
-                      config.company_info)
-
-    tags = _safe_call(generate_solicitation_tags,
-                      content_for_gpt,
-                      description,
-                      insights)
-
-    # 2.8) Compute related‐news impacts exactly as SAM pipeline did
-    news_impacts: list[dict] = []
-    if isinstance(tags, list):
-        # Load all saved RSS articles once (this is identical to run_sam_pipeline)
-        articles = load_articles_from_db()
-        sol_text = f"{content_for_gpt} {description}"
-        for art in articles:
-            art_txt = f"{art['title']} {art['description']} {art.get('content_encoded','')}"
-            if article_is_relevant(art["title"], art_txt, tags, sol_text):
-                impact_paragraph = _safe_call(
-                    generate_news_impact_paragraph,
-                    insights,
-                    art,
-                    config.company_info
-                )
-                news_impacts.append({
-                    "article_title": art["title"],
-                    "article_link": art["link"],
-                    "impact": impact_paragraph
-                })
-    else:
-        # If tags is a string (error), skip news impacts
-        news_impacts = []
+    # 2.8) GPT analysis + related-news impacts, exactly as the SAM pipeline did
+    fields, insights, swot, tags, news_impacts = _analyse(
+        _safe_call, emit,
+        content_for_gpt, description, "",   # SAM’s code passed empty string for description_byte
+        attachments,
+        sol_text=f"{attachments_text or description} {description}",
+        title=title,
+    )
 
     # 2.9) Return exactly the same keys your SAM‐pipeline row uses
     return {
@@ -222,7 +326,9 @@ def _process_sam_link(url: str) -> dict:
         "insights":     insights,
         "swot":         swot,
         "tags":         tags if isinstance(tags, list) else [tags],
-        "news_impacts": news_impacts
+        "news_impacts": news_impacts,
+        "value":            fields.get("value"),
+        "value_confidence": fields.get("value_confidence"),
     }
 
 
@@ -230,12 +336,14 @@ def _process_sam_link(url: str) -> dict:
 # 3) Core logic to process an EU Tenders link
 # ─────────────────────────────────────────────────────────────────────────────
 
-def _process_eu_link(url: str) -> dict:
+def _process_eu_link(url: str, on_event=None) -> dict:
     """
     For a given EU Tenders ‘tender‐details.html?reference=XXXXX’ URL,
     find that one item via the API, fetch attachments, run GPT steps.
     Returns a dict matching one EU pipeline row.
     """
+    emit = on_event or (lambda event: None)
+
     # 3.1) Extract the reference ID from the URL
     reference = _parse_eu_reference(url)
     if not reference:
@@ -272,7 +380,10 @@ def _process_eu_link(url: str) -> dict:
     description = meta.get("description", "") or ""
     description_byte = meta.get("descriptionByte", "") or ""
 
+    emit({"type": "meta", "info": {"title": title, "status": status, "source": "EU Tenders"}})
+
     # 3.4) Download all attachments exactly as run_eu_pipeline did:
+    emit({"type": "stage", "stage": "attachments", "status": "start"})
     attachment_paths: list[str] = []
     if status == "Open for Submission":
         cft_field = meta.get("cftDocuments", [])
@@ -303,8 +414,11 @@ def _process_eu_link(url: str) -> dict:
     if attachments:
         attachments_text = extract_text_from_files(attachments)
 
-    # 3.7) Choose content_for_gpt (exact same logic as EU pipeline)
-    content_for_gpt = attachments_text if attachments else f"{content} {description} {description_byte}"
+    emit({"type": "stage", "stage": "attachments", "status": "done", "result": attachments})
+
+    # 3.7) Choose content_for_gpt (exact same logic as EU pipeline): with attachments they
+    #      go in as extracted text, so the tender's own content is not replaced by them
+    content_for_gpt = content if attachments else f"{content} {description} {description_byte}"
 
     # 3.8) Run GPT calls with a minimal retry guard
     MAX_GPT_RETRIES = 3
@@ -319,52 +433,14 @@ def _process_eu_link(url: str) -> dict:
                     return f"[ERROR after {MAX_GPT_RETRIES} tries: {e}]"
                 time.sleep(2)
 
-    insights = _safe_call(
-        generate_insights,
-        content_for_gpt,
-        description,
-        description_byte,
-        attachments
+    fields, insights, swot, tags, news_impacts = _analyse(
+        _safe_call, emit,
+        content_for_gpt, description, description_byte,
+        attachments,
+        sol_text=f"{attachments_text or content_for_gpt} {description} {description_byte}",
+        title=title,
     )
 
-    swot = _safe_call(
-        generate_swot_analysis,
-        content_for_gpt,
-        description,
-        description_byte,
-        insights,
-        config.company_info
-    )
-
-    tags = _safe_call(
-        generate_solicitation_tags,
-        content_for_gpt,
-        description,
-        insights
-    )
-
-    # 3.9) Compute news impacts (reuse same logic)
-    news_impacts: list[dict] = []
-    if isinstance(tags, list):
-        articles = load_articles_from_db()
-        sol_text = f"{content_for_gpt} {description} {description_byte}"
-        for art in articles:
-            art_txt = f"{art['title']} {art['description']} {art['content_encoded']}"
-            if article_is_relevant(art["title"], art_txt, tags, sol_text):
-                impact_paragraph = _safe_call(
-                    generate_news_impact_paragraph,
-                    insights,
-                    art,
-                    config.company_info
-                )
-                news_impacts.append({
-                    "article_title": art["title"],
-                    "article_link": art["link"],
-                    "impact": impact_paragraph
-                })
-    else:
-        news_impacts = []
-
     # 3.10) Return a dict matching your EU pipeline’s row schema
     return {
         "source":       "EU Tenders",
@@ -375,7 +451,9 @@ def _process_eu_link(url: str) -> dict:
         "insights":     insights,
         "swot":         swot,
         "tags":         tags if isinstance(tags, list) else [tags],
-        "news_impacts": news_impacts
+        "news_impacts": news_impacts,
+        "value":            fields.get("value"),
+        "value_confidence": fields.get("value_confidence"),
     }
 
 
@@ -1,6 +1,31 @@
 
 import streamlit as st
-from single_solicitation import process_single_url
+from single_solicitation import stream_single_url
+
+_STAGE_LABELS = {
+    "attachments": "Downloading & reading attachments",
+    "analysis":    "Running structured analysis",
+    "insights":    "Generating insights",
+    "swot":        "Building SWOT",
+    "tags":        "Tagging solicitation",
+    "news":        "Matching related news",
+}
+
+
+def _render_basic_info(info: dict, url: str):
+    st.markdown("#### Basic Info")
+    st.write(f"**Title:** {info.get('title','')}")
+    st.write(f"**Status:** {info.get('status','')}")
+    st.write(f"**Source:** {info.get('source','')}")
+
+    if info.get("naics"):
+        st.write(f"**NAICS:** {info['naics']}")
+
+    if info.get("solicitation"):
+        st.write(f"**Solicitation #:** {info['solicitation']}")
+
+    st.write(f"**Link:** [{url}]({url})")
+
 
 def render_single_solicitation():
     st.title("Bid Ally – Single Solicitation Insights")
@@ -8,53 +33,88 @@ def render_single_solicitation():
 
     single_url = st.text_input("Solicitation URL", "")
     if st.button("Generate Insights") and single_url.strip():
-        with st.spinner("Processing solicitation… this may take 30–60 seconds …"):
-            try:
-                row = process_single_url(single_url.strip())
-            except Exception as e:
-                st.error(f"❌ Error: {e}")
-                return
+        url = single_url.strip()
+
+        # Placeholders are laid out up front and filled as events arrive, so
+        # each section appears as soon as its stage produces output.
+        status_box = st.empty()
+        info_box = st.container()
+
+        st.markdown('<div class="big-section-title">Insights</div>', unsafe_allow_html=True)
+        insights_box = st.empty()
+        st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+
+        st.markdown('<div class="big-section-title">SWOT</div>', unsafe_allow_html=True)
+        swot_box = st.empty()
+        st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
 
-        st.markdown("#### Basic Info")
-        st.write(f"**Title:** {row.get('title','')}")
-        st.write(f"**Status:** {row.get('status','')}")
-        st.write(f"**Source:** {row.get('source','')}")
-
-        if row.get("naics"):
-            st.write(f"**NAICS:** {row['naics']}")
-
-        if row.get("solicitation"):
-            st.write(f"**Solicitation #:** {row['solicitation']}")
-
-        st.write(f"**Link:** [{single_url.strip()}]({single_url.strip()})")
-
-        if row.get("insights"):
-            st.markdown('<div class="big-section-title">Insights</div>', unsafe_allow_html=True)
-            st.write(row['insights'])
-            st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
-
-        if row.get("swot"):
-            st.markdown('<div class="big-section-title">SWOT</div>', unsafe_allow_html=True)
-            st.write(row['swot'])
-            st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
-
-        news_impacts = row.get("news_impacts", [])
-        if isinstance(news_impacts, list) and news_impacts:
-            st.markdown('<div class="big-section-title">Related News Impacts</div>', unsafe_allow_html=True)
-            for art in news_impacts:
-                art_title = art.get("article_title", "Untitled")
-                art_link = art.get("article_link", "")
-                impact_txt = art.get("impact", "")
-                if art_link:
-                    st.markdown(f"- [{art_title}]({art_link})")
+        st.markdown('<div class="big-section-title">Related News Impacts</div>', unsafe_allow_html=True)
+        news_box = st.container()
+        news_status = news_box.empty()
+        st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+
+        text_boxes = {"insights": insights_box, "swot": swot_box}
+        impact_boxes = {}
+        impact_count = 0
+
+        status_box.info("⏳ Fetching solicitation details…")
+        for event in stream_single_url(url):
+            kind = event["type"]
+
+            if kind == "meta":
+                with info_box:
+                    _render_basic_info(event["info"], url)
+
+            elif kind == "stage":
+                stage = event["stage"]
+                if event["status"] == "start":
+                    status_box.info(f"⏳ {_STAGE_LABELS.get(stage, stage)}…")
+                elif stage in text_boxes and event.get("result"):
+                    # final (non-streamed) text replaces whatever was streamed
+                    text_boxes[stage].write(event["result"])
+                if stage == "news" and event["status"] == "start":
+                    news_status.caption("Scanning saved articles…")
+
+            elif kind == "text":
+                stage = event["stage"]
+                if stage in text_boxes:
+                    text_boxes[stage].markdown(event["text"] + " ▌")
+                elif stage.startswith("impact:"):
+                    box = impact_boxes.get(int(stage.split(":", 1)[1]))
+                    if box is not None:
+                        box.markdown(f"    • {event['text']} ▌")
+
+            elif kind == "impact":
+                n = event["index"]
+                if event["status"] == "start":
+                    art_title = event.get("article_title") or "Untitled"
+                    art_link = event.get("article_link", "")
+                    if art_link:
+                        news_box.markdown(f"- [{art_title}]({art_link})")
+                    else:
+                        news_box.markdown(f"- **{art_title}**")
+                    impact_boxes[n] = news_box.empty()
+                    impact_count += 1
                 else:
-                    st.markdown(f"- **{art_title}**")
-                st.markdown(f"    • {impact_txt}")
-            st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+                    impact_boxes[n].markdown(f"    • {event.get('impact', '')}")
+
+            elif kind == "error":
+                status_box.empty()
+                st.error(f"❌ Error: {event['error']}")
+                return
+
+            elif kind == "done":
+                status_box.success("✅ Analysis complete")
+                row = event["row"]
+                if not row.get("insights"):
+                    insights_box.empty()
+                if not row.get("swot"):
+                    swot_box.empty()
+
+        if impact_count:
+            news_status.empty()
         else:
-            st.markdown('<div class="big-section-title">Related News Impacts</div>', unsafe_allow_html=True)
-            st.markdown("**No relevant news impacts found.**")
-            st.markdown('<div class="section-divider"></div>', unsafe_allow_html=True)
+            news_status.markdown("**No relevant news impacts found.**")
 
         st.markdown("---")
     else:
@@ -0,0 +1,333 @@
+# telemetry.py
+"""
+Per-stage accounting for LLM and external-API calls.
+
+Every chat / embedding / Perplexity wrapper wraps its request in
+`track_call(stage, model)`, which records one row per logical call (after the
+scheduler's retries) with tokens, wall-clock latency, retry count and outcome.
+
+Two sinks:
+  * in-memory per-stage counters, printed at the end of a pipeline run by
+    `print_stage_summary()`;
+  * a SQLite ledger (config.TELEMETRY_DB_PATH) tagged with the current run id
+    and notice id, so latency / token percentiles can be compared per stage,
+    per notice and across runs (`python telemetry.py`, or the dashboard tab).
+
+Cached prompt tokens (provider-side prefix cache hits) are tracked separately
+so the effect of the stable prompt prefix is visible per stage.
+"""
+import math
+import time
+import uuid
+import sqlite3
+import threading
+import contextvars
+from collections import defaultdict
+from contextlib import contextmanager
+
+import config
+
+_LOCK = threading.Lock()
+_STATS: dict[str, dict] = defaultdict(lambda: {
+    "calls": 0,
+    "prompt_tokens": 0,
+    "cached_tokens": 0,
+    "completion_tokens": 0,
+    "latency_s": 0.0,
+})
+
+_local = threading.local()
+_RUN = {"id": None, "label": None}
+_NOTICE: contextvars.ContextVar = contextvars.ContextVar("telemetry_notice", default=None)
+
+
+def usage_from_response(resp) -> dict:
+    """
+    Pull token counts out of a v1 response object, a v0 dict response, or a
+    raw Batch API / Perplexity body.  Missing fields are reported as 0.
+    """
+    usage = resp.get("usage") if isinstance(resp, dict) else getattr(resp, "usage", None)
+    if usage is None:
+        return {"prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+    def _get(obj, key):
+        val = obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+        return val or 0
+
+    details = (usage.get("prompt_tokens_details") if isinstance(usage, dict)
+               else getattr(usage, "prompt_tokens_details", None)) or {}
+    return {
+        "prompt_tokens": _get(usage, "prompt_tokens"),
+        "cached_tokens": _get(details, "cached_tokens"),
+        "completion_tokens": _get(usage, "completion_tokens"),
+    }
+
+
+# ----------------------------------------------------------------------------
+# Run / notice context
+# ----------------------------------------------------------------------------
+def start_run(label: str) -> str:
+    """Begin a new run; every call recorded afterwards carries its id."""
+    _RUN["id"] = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:6]}"
+    _RUN["label"] = label
+    return _RUN["id"]
+
+
+def current_run_id() -> str | None:
+    return _RUN["id"]
+
+
+def set_notice(notice_id: str | None) -> None:
+    """Attribute calls made from here on (in this thread / context) to one solicitation."""
+    _NOTICE.set(str(notice_id) if notice_id else None)
+
+
+def bind(fn):
+    """
+    Wrap `fn` so it runs with the caller's notice context — needed when
+    handing work to a thread pool, which does not inherit context variables.
+    """
+    ctx = contextvars.copy_context()
+
+    def _bound(*args, **kwargs):
+        return ctx.copy().run(fn, *args, **kwargs)
+    return _bound
+
+
+# ----------------------------------------------------------------------------
+# Recording
+# ----------------------------------------------------------------------------
+def _conn() -> sqlite3.Connection:
+    # one connection per thread; sqlite3 connections aren't shareable
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(config.TELEMETRY_DB_PATH, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_calls (
+                id                INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts                REAL NOT NULL,
+                run_id            TEXT,
+                notice_id         TEXT,
+                provider          TEXT,
+                stage             TEXT,
+                model             TEXT,
+                prompt_tokens     INTEGER,
+                cached_tokens     INTEGER,
+                completion_tokens INTEGER,
+                latency_s         REAL,
+                retries           INTEGER,
+                outcome           TEXT,
+                error             TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_run ON llm_calls(run_id)")
+        conn.commit()
+        _local.conn = conn
+    return conn
+
+
+def record_call(stage: str, model: str, usage: dict, latency_s: float = 0.0,
+                retries: int = 0, outcome: str = "ok", error: str | None = None,
+                provider: str = "openai") -> None:
+    stage = stage or "other"
+    with _LOCK:
+        row = _STATS[stage]
+        row["calls"] += 1
+        row["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        row["cached_tokens"] += usage.get("cached_tokens", 0)
+        row["completion_tokens"] += usage.get("completion_tokens", 0)
+        row["latency_s"] += latency_s or 0.0
+
+    if not config.TELEMETRY_LEDGER:
+        return
+    try:
+        conn = _conn()
+        conn.execute(
+            "INSERT INTO llm_calls (ts, run_id, notice_id, provider, stage, model, prompt_tokens, "
+            "cached_tokens, completion_tokens, latency_s, retries, outcome, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), _RUN["id"], _NOTICE.get(), provider, stage, model,
+             usage.get("prompt_tokens", 0), usage.get("cached_tokens", 0),
+             usage.get("completion_tokens", 0), latency_s, retries, outcome,
+             (error or "")[:500] or None),
+        )
+        conn.commit()
+    except sqlite3.Error as e:
+        # telemetry must never break a pipeline run
+        print(f"⚠️ telemetry ledger write failed: {e}")
+
+
+def record_usage(stage: str, model: str, usage: dict, latency_s: float = 0.0) -> None:
+    """Record a successful call whose usage is already known (e.g. Batch API output)."""
+    record_call(stage, model, usage, latency_s)
+
+
+class _CallRecord:
+    def __init__(self):
+        self.usage: dict = {}
+        self.retries = 0
+        self.outcome = "ok"
+
+    def on_retry(self, attempt, error, delay):
+        # signature matches LLMScheduler.run(on_retry=...)
+        self.retries = attempt
+
+
+def _outcome_of(e: Exception) -> str:
+    err = str(e).lower()
+    if type(e).__name__ == "RateLimitError" or getattr(e, "status_code", None) == 429:
+        return "rate_limited"
+    if "request too large" in err or "maximum context length" in err:
+        return "too_large"
+    if "timeout" in type(e).__name__.lower():
+        return "timeout"
+    return "error"
+
+
+@contextmanager
+def track_call(stage: str, model: str, provider: str = "openai"):
+    """
+    Time one logical API call (including scheduler waits and retries) and
+    record it when the block exits.  The block fills in `rec.usage`, passes
+    `rec.on_retry` to the scheduler, and may set `rec.outcome` for failures
+    that don't raise (e.g. an HTTP error body).
+    """
+    rec = _CallRecord()
+    t_start = time.time()
+    try:
+        yield rec
+    except Exception as e:
+        record_call(stage, model, rec.usage, time.time() - t_start, rec.retries,
+                    _outcome_of(e), f"{type(e).__name__}: {e}", provider)
+        raise
+    record_call(stage, model, rec.usage, time.time() - t_start, rec.retries,
+                rec.outcome, None, provider)
+
+
+# ----------------------------------------------------------------------------
+# Reporting
+# ----------------------------------------------------------------------------
+def stage_summary() -> dict[str, dict]:
+    """Snapshot of the counters with cached-share and mean latency filled in."""
+    with _LOCK:
+        out = {}
+        for stage, row in _STATS.items():
+            r = dict(row)
+            r["cached_share"] = r["cached_tokens"] / r["prompt_tokens"] if r["prompt_tokens"] else 0.0
+            r["avg_latency_s"] = r["latency_s"] / r["calls"] if r["calls"] else 0.0
+            out[stage] = r
+        return out
+
+
+def print_stage_summary() -> None:
+    summary = stage_summary()
+    if not summary:
+        return
+    print("📊 LLM usage by stage")
+    print(f"  {'stage':<14}{'calls':>6}{'prompt':>10}{'cached':>10}{'cached%':>9}{'compl.':>9}{'avg s':>8}")
+    for stage, r in sorted(summary.items()):
+        print(f"  {stage:<14}{r['calls']:>6}{r['prompt_tokens']:>10}{r['cached_tokens']:>10}"
+              f"{r['cached_share'] * 100:>8.1f}%{r['completion_tokens']:>9}{r['avg_latency_s']:>8.2f}")
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile; `values` must be sorted."""
+    if not values:
+        return 0.0
+    k = max(0, min(len(values) - 1, math.ceil(pct / 100.0 * len(values)) - 1))
+    return values[k]
+
+
+_GROUP_COLUMNS = {"stage": "stage", "notice": "notice_id", "run": "run_id", "model": "model"}
+
+
+def ledger_report(by: str = "stage", run_id: str | None = None,
+                  since: float | None = None) -> list[dict]:
+    """
+    Aggregate the ledger per stage / notice / run / model.  Each row has call,
+    error and retry counts, p50 / p95 latency and token totals and medians.
+    `run_id` and `since` (epoch seconds) narrow the rows considered.
+    """
+    column = _GROUP_COLUMNS[by]
+    where, params = [], []
+    if run_id:
+        where.append("run_id = ?")
+        params.append(run_id)
+    if since:
+        where.append("ts >= ?")
+        params.append(since)
+    sql = (f"SELECT {column}, latency_s, prompt_tokens, cached_tokens, completion_tokens, "
+           f"retries, outcome FROM llm_calls")
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+
+    groups: dict[str, list] = defaultdict(list)
+    for key, *rest in _conn().execute(sql, params):
+        groups[key or "—"].append(rest)
+
+    report = []
+    for key, rows in groups.items():
+        lat = sorted(r[0] or 0.0 for r in rows)
+        total = sorted((r[1] or 0) + (r[3] or 0) for r in rows)
+        report.append({
+            by: key,
+            "calls": len(rows),
+            "errors": sum(1 for r in rows if r[5] != "ok"),
+            "retries": sum(r[4] or 0 for r in rows),
+            "p50_latency_s": _percentile(lat, 50),
+            "p95_latency_s": _percentile(lat, 95),
+            "total_latency_s": sum(lat),
+            "prompt_tokens": sum(r[1] or 0 for r in rows),
+            "cached_tokens": sum(r[2] or 0 for r in rows),
+            "completion_tokens": sum(r[3] or 0 for r in rows),
+            "p50_tokens": _percentile(total, 50),
+            "p95_tokens": _percentile(total, 95),
+        })
+    report.sort(key=lambda r: r["total_latency_s"], reverse=True)
+    return report
+
+
+def list_runs(limit: int = 20) -> list[dict]:
+    """Most recent runs in the ledger, newest first."""
+    rows = _conn().execute(
+        "SELECT run_id, MIN(ts), MAX(ts), COUNT(*) FROM llm_calls WHERE run_id IS NOT NULL "
+        "GROUP BY run_id ORDER BY MIN(ts) DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [{"run_id": r[0], "started": r[1], "finished": r[2], "calls": r[3]} for r in rows]
+
+
+def print_ledger_report(by: str = "stage", run_id: str | None = None) -> None:
+    report = ledger_report(by=by, run_id=run_id)
+    if not report:
+        print("ℹ️ No calls recorded in the telemetry ledger.")
+        return
+    print(f"📊 LLM / API calls by {by}" + (f" (run {run_id})" if run_id else ""))
+    print(f"  {by:<34}{'calls':>6}{'err':>5}{'retry':>6}{'p50 s':>8}{'p95 s':>8}{'total s':>9}"
+          f"{'prompt':>10}{'compl.':>9}{'p50 tok':>9}{'p95 tok':>9}")
+    for r in report:
+        print(f"  {str(r[by])[:33]:<34}{r['calls']:>6}{r['errors']:>5}{r['retries']:>6}"
+              f"{r['p50_latency_s']:>8.2f}{r['p95_latency_s']:>8.2f}{r['total_latency_s']:>9.1f}"
+              f"{r['prompt_tokens']:>10}{r['completion_tokens']:>9}{r['p50_tokens']:>9}{r['p95_tokens']:>9}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report on the LLM / API telemetry ledger.")
+    parser.add_argument("--by", choices=sorted(_GROUP_COLUMNS), default="stage")
+    parser.add_argument("--run", help="restrict to one run id")
+    parser.add_argument("--last-run", action="store_true", help="restrict to the most recent run")
+    parser.add_argument("--runs", action="store_true", help="list recent runs and exit")
+    args = parser.parse_args()
+
+    if args.runs:
+        for r in list_runs():
+            started = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["started"]))
+            print(f"  {r['run_id']:<48}{started:>18}{r['calls']:>7} calls")
+    else:
+        run = args.run
+        if args.last_run:
+            runs = list_runs(1)
+            run = runs[0]["run_id"] if runs else None
+        print_ledger_report(by=args.by, run_id=run)
@@ -0,0 +1,44 @@
+import time
+import streamlit as st
+import pandas as pd
+from telemetry import ledger_report, list_runs
+
+
+def render_telemetry():
+    st.title("LLM & API Telemetry")
+    st.markdown("Latency and token usage of every OpenAI / Perplexity call, from the telemetry ledger.")
+
+    runs = list_runs(50)
+    run_labels = {"All runs": None}
+    for r in runs:
+        started = time.strftime("%Y-%m-%d %H:%M", time.localtime(r["started"]))
+        run_labels[f"{r['run_id']}  ({started}, {r['calls']} calls)"] = r["run_id"]
+
+    col1, col2 = st.columns([3, 1])
+    run_choice = col1.selectbox("Run", list(run_labels), index=1 if runs else 0)
+    group_by = col2.radio("Group by", ["stage", "notice", "run", "model"], horizontal=False)
+
+    report = ledger_report(by=group_by, run_id=run_labels[run_choice])
+    if not report:
+        st.info("No calls recorded yet — run a pipeline or analyse a single solicitation first.")
+        return
+
+    df = pd.DataFrame(report)
+    totals = df[["calls", "errors", "retries", "total_latency_s", "prompt_tokens",
+                 "completion_tokens"]].sum()
+
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Calls", int(totals["calls"]))
+    m2.metric("Errors / retries", f"{int(totals['errors'])} / {int(totals['retries'])}")
+    m3.metric("Call time (s)", f"{totals['total_latency_s']:.0f}")
+    m4.metric("Tokens (prompt + compl.)", f"{int(totals['prompt_tokens'] + totals['completion_tokens']):,}")
+
+    st.markdown('<div class="big-section-title">Latency (seconds)</div>', unsafe_allow_html=True)
+    st.bar_chart(df.set_index(group_by)[["p50_latency_s", "p95_latency_s"]].head(25))
+
+    st.markdown('<div class="big-section-title">Breakdown</div>', unsafe_allow_html=True)
+    st.dataframe(
+        df.round({"p50_latency_s": 2, "p95_latency_s": 2, "total_latency_s": 1}),
+        use_container_width=True,
+        hide_index=True,
+    )
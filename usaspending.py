@@ -62,13 +62,22 @@ def fetch_all_awards(naics_code, lower_bound=1_000_000, upper_bound=25_000_000,
 def get_top_recipients(df: pd.DataFrame, n: int = 20) -> pd.DataFrame:
     df["award_amount"] = pd.to_numeric(df["Award Amount"], errors="coerce")
     df["recipient_name"] = df["Recipient Name"]
-    return (
+    top = (
         df.groupby("recipient_name")["award_amount"]
         .sum()
         .nlargest(n)
         .reset_index()
         .rename(columns={"award_amount": "total_awarded"})
     )
+    # UEI (most frequent per name) identifies the recipient for profile caching
+    if "Recipient UEI" in df.columns:
+        uei = (
+            df.dropna(subset=["Recipient UEI"])
+            .groupby("recipient_name")["Recipient UEI"]
+            .agg(lambda s: s.mode().iat[0])
+        )
+        top["recipient_uei"] = top["recipient_name"].map(uei)
+    return top
 
 
 def get_yearly_totals(df: pd.DataFrame) -> pd.DataFrame:
@@ -120,7 +129,18 @@ def get_all_usaspending_insights(naics_code: str) -> dict[str, pd.DataFrame]:
 
 
 
-def push_insights_to_db(insights: dict[str, pd.DataFrame], naics_code: str, db_path: str = "bid_ally.db"):
+def _add_missing_columns(conn: sqlite3.Connection, table: str, df: pd.DataFrame) -> None:
+    """Let new DataFrame columns be appended to a table created by an older version."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if not existing:
+        return      # table doesn't exist yet; to_sql creates it
+    for col in df.columns:
+        if col not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN "{col}"')
+
+
+def push_insights_to_db(insights: dict[str, pd.DataFrame], naics_code: str, db_path: str = "bid_ally.db") -> str:
+    """Store one USAspending pull under a new run id and return that id."""
     run_id = str(uuid.uuid4())
     run_timestamp = datetime.utcnow().isoformat()
 
@@ -142,9 +162,12 @@ def push_insights_to_db(insights: dict[str, pd.DataFrame], naics_code: str, db_p
         for table_name, df in insights.items():
             df["run_id"] = run_id
             db_table = f"usaspending_{table_name}"
+            _add_missing_columns(conn, db_table, df)
             df.to_sql(db_table, conn, if_exists="append", index=False)
             print(f"✅ Appended {len(df)} rows to: {db_table} (run_id={run_id})")
 
+    return run_id
+
 
 
 